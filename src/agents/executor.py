@@ -1,15 +1,34 @@
 from __future__ import annotations
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from src.tools.types import Step
 from src import orchestrator
+from src.tools.prefetch import HierarchyPrefetcher
 
 
 class Executor:
     """
     Minimal Executor:
     Delegates actual device work to orchestrator.run_step
+    settle=False leaves the post-action wait to the caller (see src/engine.py).
     """
 
+    def __init__(
+        self,
+        prefetcher: Optional[HierarchyPrefetcher] = None,
+        settle: bool = True,
+        artifact_tag: str = "",
+    ):
+        self.prefetcher = prefetcher
+        self.settle = settle
+        self.artifact_tag = artifact_tag
+
     def execute(self, step: Step, safe_test_name: str, step_index: int) -> Dict[str, Any]:
-        return orchestrator.run_step(step, safe_test_name, step_index)
+        return orchestrator.run_step(
+            step,
+            safe_test_name,
+            step_index,
+            prefetcher=self.prefetcher,
+            settle=self.settle,
+            artifact_tag=self.artifact_tag,
+        )
@@ -1,6 +1,6 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Optional, List, Tuple
 
 from src.tools.types import TestSuite, TestCase, Step
 
@@ -10,6 +10,9 @@ class PlanItem:
     test_name: str
     step_index: int
     step: Step
+    test: Optional[TestCase] = None
+    # Filled in lookahead mode: the next items the planner will hand out
+    upcoming: List["PlanItem"] = field(default_factory=list)
 
 
 class Planner:
@@ -17,12 +20,88 @@ class Planner:
     Minimal Planner:
     Runs tests in order, steps in order.
     Later you can make this smarter (conditional paths, dynamic test generation, etc).
+
+    With lookahead > 0, every item carries the next `lookahead` items in `upcoming`,
+    so work for them (e.g. hierarchy prefetch) can start early.
+
+    A matrix instance skips its setup steps when the instance right before it
+    (same template, same device) ran the same setup steps (no parameter in
+    them differs) and got to the end without a failed step; the engine
+    reports failures with fail_test().
     """
 
-    def __init__(self, suite: TestSuite):
+    def __init__(self, suite: TestSuite, lookahead: int = 0):
         self.suite = suite
+        self.lookahead = lookahead
         self._test_i = 0
         self._step_i = 0
+        self._failed = False
+        # (template, setup steps) that left the device in its post-setup state
+        self._setup_done: Optional[Tuple[str, List[Step]]] = None
+
+    def _skips_setup(self, test: TestCase, setup_done: Optional[Tuple[str, List[Step]]]) -> bool:
+        if not (test.setup_steps and test.template and setup_done):
+            return False
+        return setup_done == (test.template, test.steps[: test.setup_steps])
+
+    def _after(self, test: TestCase, failed: bool) -> Optional[Tuple[str, List[Step]]]:
+        # what the next test may rely on once `test` is done
+        if test.setup_steps and test.template and not failed:
+            return test.template, test.steps[: test.setup_steps]
+        return None
+
+    def _enter(self, test_i: int) -> None:
+        self._test_i = test_i
+        self._step_i = 0
+        self._failed = False
+        if test_i < len(self.suite.tests):
+            test: TestCase = self.suite.tests[test_i]
+            if self._skips_setup(test, self._setup_done):
+                self._step_i = test.setup_steps
+
+    def peek(self, count: int = 1) -> List[PlanItem]:
+        """
+        Returns up to `count` upcoming items without advancing the planner.
+        Later tests are predicted assuming the current one passes.
+        """
+        items: List[PlanItem] = []
+        test_i, step_i = self._test_i, self._step_i
+        failed = self._failed
+
+        while test_i < len(self.suite.tests) and len(items) < count:
+            test: TestCase = self.suite.tests[test_i]
+            if step_i < len(test.steps):
+                items.append(
+                    PlanItem(
+                        test_name=test.name,
+                        step_index=step_i + 1,
+                        step=test.steps[step_i],
+                        test=test,
+                    )
+                )
+                step_i += 1
+            else:
+                setup_done = self._after(test, failed)
+                test_i += 1
+                step_i = 0
+                failed = False
+                if test_i < len(self.suite.tests) and self._skips_setup(self.suite.tests[test_i], setup_done):
+                    step_i = self.suite.tests[test_i].setup_steps
+
+        return items
+
+    def skip_test(self) -> None:
+        """
+        Drops the remaining steps of the current test; next_item() continues with the next test.
+        """
+        if self._test_i < len(self.suite.tests):
+            self._step_i = len(self.suite.tests[self._test_i].steps)
+
+    def fail_test(self) -> None:
+        """
+        Marks the current test as failed: the next instance runs its setup again.
+        """
+        self._failed = True
 
     def next_item(self) -> Optional[PlanItem]:
         # Move through tests sequentially
@@ -34,12 +113,15 @@ class Planner:
                     test_name=test.name,
                     step_index=self._step_i + 1,
                     step=test.steps[self._step_i],
+                    test=test,
                 )
                 self._step_i += 1
+                if self.lookahead > 0:
+                    item.upcoming = self.peek(self.lookahead)
                 return item
 
             # finished this test, move to next
-            self._test_i += 1
-            self._step_i = 0
+            self._setup_done = self._after(test, self._failed)
+            self._enter(self._test_i + 1)
 
         return None
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 
 @dataclass
@@ -36,9 +36,37 @@ class Supervisor:
 
         return "UNKNOWN_FAILURE"
 
+    def _classify_perf(self, record: Dict[str, Any]) -> Optional[str]:
+        """
+        A step/test that passed but breached its latency budget or the
+        historical p95 (see src/tools/perf.py) is a perf regression.
+        """
+        perf = record.get("perf") or {}
+        if perf.get("breaches"):
+            return "PERF_REGRESSION"
+        return None
+
+    def review_test(self, test_record: Dict[str, Any]) -> None:
+        """
+        Classifies a finished test; a passing test over its duration SLO / p95
+        keeps status PASS but gets failure_type PERF_REGRESSION.
+        """
+        if test_record.get("status") == "PASS":
+            perf_type = self._classify_perf(test_record)
+            if perf_type:
+                test_record["failure_type"] = perf_type
+
     def decide(self, test_name: str, step_index: int, step_record: Dict[str, Any]) -> SupervisorDecision:
-        # Step passed -> just move on
+        # Step passed -> just move on (flag it if it was too slow)
         if step_record.get("ok", False):
+            perf_type = self._classify_perf(step_record)
+            if perf_type:
+                step_record["failure_type"] = perf_type
+                breaches = ",".join(step_record["perf"]["breaches"])
+                return SupervisorDecision(
+                    action="continue",
+                    reason=f"Step passed but was slow ({breaches}); failure_type={perf_type}",
+                )
             return SupervisorDecision(action="continue", reason="Step passed")
 
         # Step failed -> reason about the failure
@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from src.orchestrator import load_suite, _safe_name, _ts, LOGS_DIR, SHOTS_DIR
+from src.tools import adb
+from src.tools import perf
+from src.tools.capture import CapturePolicy, CaptureEncoder, CAPTURE_POLICIES
+from src.tools import events
+from src.tools.prefetch import HierarchyPrefetcher, prefetch_stats
+from src.tools.steps import StepHandler, get_handler
+from src.tools.types import TestSuite, TestCase, matrix_work
+
+from src.agents.planner import Planner, PlanItem
+from src.agents.executor import Executor
+from src.agents.supervisor import Supervisor
+
+
+# With a device event stream: UI counts as settled after this long without events
+QUIET_SECONDS = 0.3
+
+
+class StepEngine:
+    """
+    The single run loop: Planner -> Executor -> Supervisor.
+
+    Waits and captures follow the capabilities each step handler declares
+    (src/tools/steps.py) instead of happening blindly after every action:
+    - settle: after a step that actually changed the screen, the next step that
+      observes or mutates the screen waits out the remaining settle time
+      (a `sleep` step in between counts towards it).
+    - capture: after a screen-changing step an evidence screenshot is taken only
+      if the next step of the same test does not look at the screen itself,
+      and after a failed step that captured nothing.
+    - cache: the hierarchy prefetcher is keyed on the screen generation, which
+      every screen-changing adb call bumps.
+    - with a ScreenWatcher whose source reports content changes, the settle wait
+      ends as soon as the device reported a UI change after the action and then
+      went quiet for QUIET_SECONDS. A window-level source (logcat) goes quiet
+      before the content has rendered, so it never shortens the handler's settle.
+    - fidelity: once a step's outcome is final its frames are re-encoded per
+      the capture policy (src/tools/capture.py) in a worker process pool.
+    - latency: a screen-changing step's duration_ms includes its settle window
+      (settle_ms), even though the wait itself happens later and may overlap
+      with e.g. a sleep step, so budgets and the p95 history keep measuring
+      "action until the UI can be trusted".
+    """
+
+    def __init__(
+        self,
+        suite: TestSuite,
+        run_id: Optional[str] = None,
+        prefetch: bool = False,
+        skip_rest_on_stop: bool = False,
+        history: Optional[perf.LatencyHistory] = None,
+        max_retries_per_step: int = 1,
+        capture_policy: Optional[CapturePolicy] = None,
+        watcher: Optional[events.ScreenWatcher] = None,
+        artifact_tag: str = "",
+    ):
+        self.suite = suite
+        self.run_id = run_id or _ts()
+        self.skip_rest_on_stop = skip_rest_on_stop
+        self.history = history
+
+        # only the very next step can be prefetched: any later one would look at
+        # a screen that a screen-changing step (or a sleep) in between still alters
+        self.planner = Planner(suite, lookahead=1 if prefetch else 0)
+        self.prefetcher = HierarchyPrefetcher(SHOTS_DIR, run_id=self.run_id) if prefetch else None
+        # keeps artifact names of parallel devices apart (shared artifacts dir)
+        self.artifact_tag = artifact_tag
+        self.executor = Executor(prefetcher=self.prefetcher, settle=False, artifact_tag=artifact_tag)
+        self.supervisor = Supervisor(max_retries_per_step=max_retries_per_step)
+        self.encoder = CaptureEncoder(capture_policy) if capture_policy and capture_policy.by_kind else None
+
+        self.watcher = watcher
+        self._settled_at = 0.0  # time.monotonic() when the last screen change has settled
+        self._action_generation = 0  # watcher generation when the last screen change was made
+
+    def _artifact_name(self, test_name: str) -> str:
+        if self.artifact_tag:
+            return _safe_name(f"{self.artifact_tag}_{test_name}")
+        return _safe_name(test_name)
+
+    def _wait_settled(self) -> float:
+        """
+        Sleeps out whatever is left of the last settle window. Returns ms waited.
+        """
+        started = time.monotonic()
+        remaining = self._settled_at - started
+        if remaining <= 0:
+            return 0.0
+        if self.watcher is not None and self.watcher.sees_content:
+            if self.watcher.wait_quiet(self._action_generation, QUIET_SECONDS, remaining):
+                # settled early: later waits in this window are not needed either
+                self._settled_at = time.monotonic()
+        else:
+            adb.sleep(remaining)
+        return (time.monotonic() - started) * 1000
+
+    def _schedule_prefetch(self, item: PlanItem, handler: Optional[StepHandler]) -> None:
+        """
+        Speculatively prefetch the hierarchy the next tap_target will look at.
+        Called before a screen-changing step runs (the prefetch waits for its action
+        and settle time), otherwise after the step ran: a step like `sleep` may be
+        waiting for the screen to change by itself, so its time is not safe to dump in.
+        Either way the dump waits out the settle time the engine still owes.
+        """
+        mutates = bool(handler and handler.mutates_screen)
+        for nxt in item.upcoming:
+            if nxt.step.type == "tap_target":
+                self.prefetcher.schedule(
+                    self._artifact_name(nxt.test_name),
+                    nxt.step_index,
+                    expect_change=mutates,
+                    settle_seconds=handler.settle_seconds if mutates else 0.0,
+                    not_before=self._settled_at,
+                )
+
+    def _needs_capture(
+        self,
+        handler: Optional[StepHandler],
+        rec: Dict[str, Any],
+        mutated: bool,
+        nxt: Optional[PlanItem],
+        test_name: str,
+    ) -> bool:
+        if not rec.get("ok"):
+            # evidence of the failed state, unless the step already took some
+            return not (rec.get("screenshot") or rec.get("locate_screenshot"))
+        if not mutated:
+            return False
+        nxt_handler = get_handler(nxt.step.type) if nxt and nxt.test_name == test_name else None
+        return not (nxt_handler and nxt_handler.observes_screen)
+
+    def _capture(self, safe_test: str, step_index: int, attempt: int, rec: Dict[str, Any]) -> None:
+        self._wait_settled()
+        suffix = f"_retry{attempt - 1}" if attempt > 1 else ""
+        auto_path = SHOTS_DIR / f"{self.run_id}_{safe_test}_after_{step_index}{suffix}.png"
+        try:
+            adb.screenshot(auto_path)
+            rec["auto_screenshot"] = str(auto_path)
+        except Exception as e:
+            rec["auto_screenshot_error"] = str(e)
+
+    def _restore_locales(self) -> None:
+        # a matrix over set_locale must not leak its last locale into later tests
+        # (or, on a warm pooled emulator, into the next run)
+        if adb.restore_app_locales():
+            handler = get_handler("set_locale")
+            self._settled_at = time.monotonic() + (handler.settle_seconds if handler else 0.0)
+
+    def _finish_test(self, run_log: Dict[str, Any], test_rec: Dict[str, Any], test: TestCase) -> None:
+        perf.check_test(test_rec, test, self.history)
+        self.supervisor.review_test(test_rec)
+        run_log["tests"].append(test_rec)
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Runs the whole suite and returns the run log dict.
+        """
+        SHOTS_DIR.mkdir(parents=True, exist_ok=True)
+
+        run_log: Dict[str, Any] = {
+            "run_id": self.run_id,
+            "suite": {"name": self.suite.name, "description": self.suite.description},
+            "tests": [],
+        }
+
+        current_test_name = None
+        current_test = None
+        current_test_rec = None
+
+        # cleanup runs even if a step raises (e.g. adb lost the device), so
+        # pending encodes are finished and the app's locale is put back
+        try:
+            while True:
+                item = self.planner.next_item()
+                if item is None:
+                    break
+
+                # start new test record when test changes
+                if current_test_name != item.test_name:
+                    if current_test_rec is not None:
+                        self._finish_test(run_log, current_test_rec, current_test)
+                        if current_test.template and current_test.template != item.test.template:
+                            self._restore_locales()
+                    current_test_name = item.test_name
+                    current_test = item.test
+                    current_test_rec = {"name": item.test_name, "steps": [], "status": "PASS"}
+                    if current_test.params is not None:
+                        current_test_rec["template"] = current_test.template
+                        current_test_rec["params"] = current_test.params
+                        # setup steps not run because the previous instance left the device set up
+                        current_test_rec["setup_skipped"] = item.step_index - 1
+
+                safe_test = self._artifact_name(item.test_name)
+                handler = get_handler(item.step.type)
+                upcoming = self.planner.peek(1)
+                nxt = upcoming[0] if upcoming else None
+
+                mutates = bool(handler and handler.mutates_screen)
+                if self.prefetcher is not None and mutates:
+                    self._schedule_prefetch(item, handler)
+
+                # Execute step, let supervisor decide
+                attempt = 0
+                while True:
+                    attempt += 1
+                    waited = 0.0
+                    if handler is None or handler.observes_screen or handler.mutates_screen:
+                        waited = self._wait_settled()
+
+                    gen_before = adb.screen_generation()
+                    device_gen_before = self.watcher.generation if self.watcher else 0
+                    rec = self.executor.execute(item.step, safe_test, item.step_index)
+                    mutated = adb.screen_generation() != gen_before
+                    if waited:
+                        rec["settle_wait_ms"] = round(waited, 1)
+                    if mutated and handler is not None:
+                        self._settled_at = time.monotonic() + handler.settle_seconds
+                        self._action_generation = device_gen_before
+                        # latency = action + settle window, as when the settle sleep ran
+                        # inline; keeps budgets and p95 history comparable across runs
+                        if handler.settle_seconds:
+                            rec["settle_ms"] = handler.settle_seconds * 1000
+                            rec["duration_ms"] = round(rec["duration_ms"] + rec["settle_ms"], 1)
+
+                    current_test_rec["steps"].append(rec)
+                    perf.check_step(rec, item.step, item.test_name, self.history)
+
+                    decision = self.supervisor.decide(item.test_name, item.step_index, rec)
+                    rec["supervisor_action"] = decision.action
+                    rec["supervisor_reason"] = decision.reason
+
+                    if self._needs_capture(handler, rec, mutated, nxt, item.test_name):
+                        self._capture(safe_test, item.step_index, attempt, rec)
+
+                    if self.encoder is not None:
+                        self.encoder.submit(rec)
+
+                    if decision.action == "continue":
+                        if self.prefetcher is not None and not mutates:
+                            self._schedule_prefetch(item, handler)
+                        break
+
+                    # failed step: the screen sequence we prefetched for is no longer reliable
+                    if self.prefetcher is not None:
+                        self.prefetcher.discard()
+
+                    if decision.action == "retry":
+                        continue
+
+                    if decision.action == "stop":
+                        current_test_rec["status"] = "FAIL"
+                        self.planner.fail_test()
+                        if self.skip_rest_on_stop:
+                            self.planner.skip_test()
+                        break
+
+
+            # append last test
+            if current_test_rec is not None:
+                self._finish_test(run_log, current_test_rec, current_test)
+        finally:
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+                run_log["prefetch"] = self.prefetcher.stats()
+
+            if self.encoder is not None:
+                run_log["captures"] = self.encoder.finish()
+
+            self._restore_locales()
+
+        return run_log
+
+
+def run_shard(
+    yaml_path: str,
+    serial: Optional[str] = None,
+    shard_index: int = 0,
+    work: Optional["queue.Queue"] = None,
+    run_id: Optional[str] = None,
+    prefetch: bool = False,
+    capture_policy: str = "full",
+    event_source: str = "none",
+) -> Dict[str, Any]:
+    """
+    Runs one device's share of the suite and returns its run log.
+    Also the fan-out worker entry point: adb pins one device per process,
+    so every device gets its own process. With a `work` queue the device runs
+    the plain tests only if it is shard 0, plus whatever matrix instances it
+    claims from the queue (see TestSuite.worker_share).
+    """
+    if serial:
+        adb.use_device(serial)
+    adb.wait_for_device()
+
+    suite = load_suite(yaml_path)
+    if work is not None:
+        suite = suite.worker_share(work, run_plain=shard_index == 0)
+
+    watcher = None
+    if event_source != "none":
+        watcher = events.start_watcher(event_source)
+        events.set_active(watcher)
+
+    # Rolling step/test latencies from previous runs, for p95 regression checks
+    history = perf.LatencyHistory.from_logs([LOGS_DIR])
+
+    engine = StepEngine(
+        suite,
+        run_id=run_id,
+        prefetch=prefetch,
+        history=history,
+        capture_policy=CAPTURE_POLICIES[capture_policy],
+        watcher=watcher,
+        artifact_tag=f"d{shard_index}" if work is not None else "",
+    )
+    run_log = engine.run()
+
+    if watcher is not None:
+        watcher.stop()
+        events.set_active(None)
+        run_log["event_source"] = watcher.source
+        run_log["screen_generation"] = watcher.generation
+    if serial:
+        run_log["device"] = serial
+    return run_log
+
+
+def _merge_shard_totals(run_log: Dict[str, Any], shard_logs: List[Dict[str, Any]]) -> None:
+    """
+    Sums the per-shard prefetch and capture totals into run-level ones
+    (same shape as a single-device run log).
+    """
+    prefetch = [log["prefetch"] for log in shard_logs if "prefetch" in log]
+    if prefetch:
+        counts = {k: sum(p[k] for p in prefetch) for k in prefetch[0] if not k.endswith("_rate")}
+        run_log["prefetch"] = prefetch_stats(counts)
+
+    captures = [log["captures"] for log in shard_logs if "captures" in log]
+    if captures:
+        run_log["captures"] = {
+            "policy": captures[0]["policy"],
+            **{k: sum(c[k] for c in captures) for k in captures[0] if k != "policy"},
+        }
+
+
+def run_fanout(yaml_path: str, serials: List[str], **shard_options: Any) -> Dict[str, Any]:
+    """
+    Runs the suite on several devices in parallel and merges the shard logs into
+    one run log; each test record names its device. The plain tests run once, on
+    the first device; matrix instances are handed out from a shared queue, so a
+    device that finishes early picks up more. A shard that crashes is recorded
+    under "shard_errors" instead of losing the other devices' results.
+    Prefetch and capture totals are summed over the shards (each shard's own
+    stay under "shards").
+    """
+    run_id = _ts()
+    suite = load_suite(yaml_path)
+
+    with multiprocessing.Manager() as manager:
+        work = manager.Queue()
+        for item in matrix_work(suite.templates):
+            work.put(item)
+
+        with ProcessPoolExecutor(max_workers=len(serials)) as pool:
+            futures = [
+                pool.submit(run_shard, yaml_path, serial, i, work, run_id, **shard_options)
+                for i, serial in enumerate(serials)
+            ]
+            shard_logs: List[Dict[str, Any]] = []
+            shard_errors: List[Dict[str, Any]] = []
+            for i, (serial, future) in enumerate(zip(serials, futures)):
+                try:
+                    shard_logs.append(future.result())
+                except Exception as e:
+                    shard_errors.append({"shard": i, "device": serial, "error": f"{type(e).__name__}: {e}"})
+
+        unclaimed = work.qsize()
+
+    run_log: Dict[str, Any] = {
+        "run_id": run_id,
+        "suite": {"name": suite.name, "description": suite.description},
+        "devices": serials,
+        "tests": [],
+        "shards": [],
+    }
+    for log in shard_logs:
+        for test_rec in log["tests"]:
+            test_rec["device"] = log.get("device")
+            run_log["tests"].append(test_rec)
+        run_log["shards"].append({k: v for k, v in log.items() if k not in ("suite", "tests")})
+    _merge_shard_totals(run_log, shard_logs)
+    if shard_errors:
+        run_log["shard_errors"] = shard_errors
+    if unclaimed:
+        # every worker died before the queue ran dry
+        run_log["unclaimed_instances"] = unclaimed
+    return run_log
@@ -1,93 +1,109 @@
 from __future__ import annotations
 
-from src.orchestrator import load_suite, _safe_name, LOGS_DIR, SHOTS_DIR
+from src.orchestrator import LOGS_DIR, SHOTS_DIR
 from src.tools import adb
 
-from src.agents.planner import Planner
-from src.agents.executor import Executor
-from src.agents.supervisor import Supervisor
+from src.engine import run_shard, run_fanout
+from src.tools import runlog
+from src.tools.devicepool import DevicePool
+from src.tools.capture import CAPTURE_POLICIES
 
+import argparse
 import json
-from datetime import datetime
-from pathlib import Path
-from typing import Dict, Any
+from typing import List, Optional
 
 
-def _ts() -> str:
-    return datetime.now().strftime("%Y%m%d_%H%M%S")
+SUITE_PATH = "src/testsuites/obsidian_suite.yaml"
 
 
 def main() -> None:
-    suite = load_suite("src/testsuites/obsidian_suite.yaml")
+    parser = argparse.ArgumentParser(description="Run the mobile QA suite")
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="Prefetch the UI hierarchy for the next tap_target while the current step runs",
+    )
+    parser.add_argument(
+        "--compact-log",
+        action="store_true",
+        help="Also append the run to artifacts/logs/runs.jsonl.gz (compact format, see src/tools/runlog.py)",
+    )
+    parser.add_argument(
+        "--avd",
+        default="",
+        help="Lease a headless emulator of this AVD from the warm device pool (booted if not running)",
+    )
+    parser.add_argument(
+        "--capture-policy",
+        choices=sorted(CAPTURE_POLICIES),
+        default="full",
+        help="Fidelity of debug frames (locate/auto screenshots); screenshot steps and failures stay full",
+    )
+    parser.add_argument(
+        "--devices",
+        type=int,
+        default=1,
+        help="Fan out over this many devices (pooled emulators with --avd, else attached ones); "
+        "plain tests run once on the first, matrix instances go to whichever device is free",
+    )
+    parser.add_argument(
+        "--event-source",
+        # not accessibility: it can block the hierarchy dumps tap_target needs
+        # (run_shard still accepts it and falls back to logcat, see events.start_watcher)
+        choices=["none", "logcat"],
+        default="none",
+        help="Watch a device-side UI event stream; logcat replaces the prefetcher's dumpsys "
+        "screen check but does not shorten settle waits (see src/tools/events.py)",
+    )
+    args = parser.parse_args()
 
     LOGS_DIR.mkdir(parents=True, exist_ok=True)
     SHOTS_DIR.mkdir(parents=True, exist_ok=True)
 
-    adb.wait_for_device()
-
-    planner = Planner(suite)
-    executor = Executor()
-    supervisor = Supervisor(max_retries_per_step=1)
-
-    run_id = _ts()
-    run_log_path = Path("artifacts/logs") / f"run_{run_id}.json"
-
-    run_log: Dict[str, Any] = {
-        "run_id": run_id,
-        "suite": {"name": suite.name, "description": suite.description},
-        "tests": [],
+    pool = None
+    leased = []
+    serials: List[Optional[str]] = [None]  # None = adb's default device
+    if args.avd:
+        pool = DevicePool(args.avd, size=args.devices)
+        pool.start()
+        leased = [pool.lease() for _ in range(args.devices)]
+        serials = [d.serial for d in leased]
+    elif args.devices > 1:
+        attached = [s for s, state in adb.parse_devices(adb.devices()).items() if state == "device"]
+        if len(attached) < args.devices:
+            raise RuntimeError(f"--devices {args.devices} but only {len(attached)} adb device(s) attached")
+        serials = attached[: args.devices]
+
+    shard_options = {
+        "prefetch": args.prefetch,
+        "capture_policy": args.capture_policy,
+        "event_source": args.event_source,
     }
+    if len(serials) == 1:
+        run_log = run_shard(SUITE_PATH, serials[0], **shard_options)
+    else:
+        run_log = run_fanout(SUITE_PATH, serials, **shard_options)
 
-    current_test_name = None
-    current_test_rec = None
-
-    while True:
-        item = planner.next_item()
-        if item is None:
-            break
-
-        # start new test record when test changes
-        if current_test_name != item.test_name:
-            if current_test_rec is not None:
-                run_log["tests"].append(current_test_rec)
-            current_test_name = item.test_name
-            current_test_rec = {"name": item.test_name, "steps": [], "status": "PASS"}
-
-        safe_test = _safe_name(item.test_name)
+    if "prefetch" in run_log:
+        print(f"Prefetch: {run_log['prefetch']}")
+    if "captures" in run_log:
+        print(f"Captures: {run_log['captures']}")
 
-        # Execute step, let supervisor decide
-        while True:
-            rec = executor.execute(item.step, safe_test, item.step_index)
-            current_test_rec["steps"].append(rec)
+    run_log_path = LOGS_DIR / f"run_{run_log['run_id']}.json"
 
-            decision = supervisor.decide(item.test_name, item.step_index, rec)
-            rec["supervisor_action"] = decision.action
-            rec["supervisor_reason"] = decision.reason
-
-            if decision.action == "continue":
-                break
-
-            if decision.action == "retry":
-                continue
-
-            if decision.action == "stop":
-                current_test_rec["status"] = "FAIL"
-                # skip remaining steps in this test by advancing planner until test changes
-                # simplest: just mark fail; planner will still output remaining steps unless you add skip logic
-                break
-
-        if current_test_rec["status"] == "FAIL":
-            # Optional: stop entire run on first test failure
-            # break
-            pass
-
-    # append last test
-    if current_test_rec is not None:
-        run_log["tests"].append(current_test_rec)
+    if pool is not None:
+        # emulators stay warm for the next run
+        for device in leased:
+            pool.release(device)
+        pool.shutdown(keep_warm=True)
 
     run_log_path.write_text(json.dumps(run_log, indent=2), encoding="utf-8")
     print(f"Done. Run log saved to: {run_log_path}")
 
+    if args.compact_log:
+        compact_path = runlog.append_run(LOGS_DIR / f"runs{runlog.COMPACT_SUFFIX}", run_log)
+        print(f"Run appended to: {compact_path}")
+
 
 if __name__ == "__main__":
     main()
@@ -1,15 +1,18 @@
 from __future__ import annotations
 
 import json
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 import yaml
 
 from src.tools import adb
 from src.tools.types import parse_suite, TestSuite, Step
 from src.tools import vision
+from src.tools.prefetch import HierarchyPrefetcher
+from src.tools.steps import StepContext, step_handler, get_handler
 
 
 ARTIFACTS_DIR = Path("artifacts")
@@ -37,9 +40,132 @@ def load_suite(path: str) -> TestSuite:
     return parse_suite(data)
 
 
-def run_step(step: Step, test_name: str, step_index: int) -> Dict[str, Any]:
+# ---------- step handlers ----------
+# Each handler only performs its action; waiting for the UI to settle and
+# capturing evidence is left to the engine (src/engine.py), driven by the
+# capabilities declared here.
+
+@step_handler("launch_app", mutates_screen=True, settle_seconds=5.0)
+def _launch_app(step: Step, ctx: StepContext, record: Dict[str, Any]) -> None:
+    if not step.app:
+        raise ValueError("launch_app requires 'app'")
+    adb.launch_app(step.app)
+
+
+@step_handler("tap", mutates_screen=True, settle_seconds=0.7)
+def _tap(step: Step, ctx: StepContext, record: Dict[str, Any]) -> None:
+    if step.x is None or step.y is None:
+        raise ValueError("tap requires x and y")
+    adb.tap(step.x, step.y)
+
+
+@step_handler("input_text", mutates_screen=True, settle_seconds=0.5)
+def _input_text(step: Step, ctx: StepContext, record: Dict[str, Any]) -> None:
+    if step.text is None:
+        raise ValueError("input_text requires text")
+    adb.input_text(step.text)
+
+
+@step_handler("keyevent", mutates_screen=True, settle_seconds=0.5)
+def _keyevent(step: Step, ctx: StepContext, record: Dict[str, Any]) -> None:
+    if step.keycode is None:
+        raise ValueError("keyevent requires keycode")
+    adb.keyevent(step.keycode)
+
+
+@step_handler("set_locale", mutates_screen=True, settle_seconds=1.0)
+def _set_locale(step: Step, ctx: StepContext, record: Dict[str, Any]) -> None:
+    if not step.app or not step.locale:
+        raise ValueError("set_locale requires 'app' and 'locale'")
+    adb.set_app_locale(step.app, step.locale)
+
+
+@step_handler("sleep")
+def _sleep(step: Step, ctx: StepContext, record: Dict[str, Any]) -> None:
+    seconds = step.sleep_seconds or 1.0
+    adb.sleep(seconds)
+
+
+@step_handler("screenshot", observes_screen=True)
+def _screenshot(step: Step, ctx: StepContext, record: Dict[str, Any]) -> None:
+    if step.path:
+        out_path = Path(step.path)
+        if ctx.artifact_tag:
+            out_path = out_path.with_name(f"{ctx.artifact_tag}_{out_path.name}")
+    else:
+        out_path = SHOTS_DIR / f"{_ts()}_{ctx.test_name}_step{ctx.step_index}.png"
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    adb.screenshot(out_path)
+    record["screenshot"] = str(out_path)
+
+
+@step_handler("tap_target", observes_screen=True, mutates_screen=True, settle_seconds=0.8)
+def _tap_target(step: Step, ctx: StepContext, record: Dict[str, Any]) -> None:
+    if not step.target:
+        raise ValueError("tap_target requires 'target'")
+
+    locate_shot = SHOTS_DIR / f"{_ts()}_{ctx.test_name}_locate_step{ctx.step_index}.png"
+    adb.screenshot(locate_shot)
+    record["locate_screenshot"] = str(locate_shot)
+
+    root = None
+    if ctx.prefetcher is not None:
+        pre = ctx.prefetcher.take(ctx.test_name, ctx.step_index)
+        record["prefetch_hit"] = pre is not None
+        if pre is not None:
+            root = pre.root
+            record["prefetch_xml"] = str(pre.xml_path)
+
+    # Try primary target
+    result = vision.locate_tap_point(
+        screenshot_path=locate_shot,
+        target=step.target,
+        hint=step.hint,
+        root=root,
+    )
+    record["vision"] = result
+    used_target = step.target
+
+    # If that failed, try alt target
+    if not result.get("found") and getattr(step, "alt_target", None):
+        alt_result = vision.locate_tap_point(
+            screenshot_path=locate_shot,
+            target=step.alt_target,
+            hint=step.hint,
+            root=root,
+        )
+        record["vision_alt"] = alt_result
+        if alt_result.get("found"):
+            result = alt_result
+            used_target = step.alt_target
+
+    if not result.get("found"):
+        raise RuntimeError(
+            f"Could not find target '{step.target}' or alt_target '{step.alt_target}'"
+        )
+
+    record["used_target"] = used_target
+
+    x = int(result["x"])
+    y = int(result["y"])
+    adb.tap(x, y)
+
+
+def run_step(
+    step: Step,
+    test_name: str,
+    step_index: int,
+    prefetcher: Optional[HierarchyPrefetcher] = None,
+    settle: bool = True,
+    artifact_tag: str = "",
+) -> Dict[str, Any]:
     """
-    Executes one YAML step. Returns a dict record you can log.
+    Executes one YAML step via its registered handler. Returns a dict record you can log.
+    If a prefetcher is given, tap_target reuses a prefetched UI hierarchy when still valid.
+    settle=False skips the post-action wait; the caller (the engine) then owns it,
+    and duration_ms only covers the action.
+    artifact_tag is prefixed to explicit screenshot paths (one tag per device on fan-out).
     """
     record: Dict[str, Any] = {
         "type": step.type,
@@ -48,104 +174,34 @@ def run_step(step: Step, test_name: str, step_index: int) -> Dict[str, Any]:
         "error": None,
         "screenshot": None,
     }
+    started = time.perf_counter()
 
     try:
-        if step.type == "launch_app":
-            if not step.app:
-                raise ValueError("launch_app requires 'app'")
-            adb.launch_app(step.app)
-            adb.sleep(5.0)
-
-        elif step.type == "tap":
-            if step.x is None or step.y is None:
-                raise ValueError("tap requires x and y")
-            adb.tap(step.x, step.y)
-            adb.sleep(0.7)
-
-        elif step.type == "input_text":
-            if step.text is None:
-                raise ValueError("input_text requires text")
-            adb.input_text(step.text)
-            adb.sleep(0.5)
-
-        elif step.type == "sleep":
-            seconds = step.sleep_seconds or 1.0
-            adb.sleep(seconds)
-
-        elif step.type == "screenshot":
-            if step.path:
-                out_path = Path(step.path)
-            else:
-                out_path = SHOTS_DIR / f"{_ts()}_{test_name}_step{step_index}.png"
-
-            out_path.parent.mkdir(parents=True, exist_ok=True)
-            adb.screenshot(out_path)
-            record["screenshot"] = str(out_path)
-
-        elif step.type == "tap_target":
-            if not step.target:
-                raise ValueError("tap_target requires 'target'")
-
-            locate_shot = SHOTS_DIR / f"{_ts()}_{test_name}_locate_step{step_index}.png"
-            adb.screenshot(locate_shot)
-            record["locate_screenshot"] = str(locate_shot)
-
-            # Try primary target
-            result = vision.locate_tap_point(
-                screenshot_path=locate_shot,
-                target=step.target,
-                hint=step.hint,
-            )
-            record["vision"] = result
-            used_target = step.target
-
-            # If that failed, try alt target
-            if not result.get("found") and getattr(step, "alt_target", None):
-                alt_result = vision.locate_tap_point(
-                    screenshot_path=locate_shot,
-                    target=step.alt_target,
-                    hint=step.hint,
-                )
-                record["vision_alt"] = alt_result
-                if alt_result.get("found"):
-                    result = alt_result
-                    used_target = step.alt_target
-
-            if not result.get("found"):
-                raise RuntimeError(
-                    f"Could not find target '{step.target}' or alt_target '{step.alt_target}'"
-                )
-
-            record["used_target"] = used_target
-
-            x = int(result["x"])
-            y = int(result["y"])
-            adb.tap(x, y)
-            adb.sleep(0.8)
-
-            after_tap_path = SHOTS_DIR / f"{_ts()}_{test_name}_after_tap_target_{step_index}.png"
-            adb.screenshot(after_tap_path)
-            record["after_tap_screenshot"] = str(after_tap_path)
-        
-        elif step.type == "keyevent":
-            if step.keycode is None:
-                raise ValueError("keyevent requires keycode")
-            adb.keyevent(step.keycode)
-            adb.sleep(0.5)
-
-
-
-        else:
+        handler = get_handler(step.type)
+        if handler is None:
             raise ValueError(f"Unknown step type: {step.type}")
 
+        handler.func(step, StepContext(test_name, step_index, prefetcher, artifact_tag), record)
+
+        if settle and handler.settle_seconds:
+            adb.sleep(handler.settle_seconds)
+
     except Exception as e:
         record["ok"] = False
         record["error"] = str(e)
 
+    record["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
     return record
 
 
 def run_suite(yaml_path: str) -> Path:
+    """
+    Runs a suite through the step engine and writes the run log.
+    Stops a test at its first failure that the Supervisor won't retry.
+    """
+    # imported here: the engine's agents import this module
+    from src.engine import StepEngine
+
     LOGS_DIR.mkdir(parents=True, exist_ok=True)
     SHOTS_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -153,38 +209,7 @@ def run_suite(yaml_path: str) -> Path:
 
     adb.wait_for_device()
 
-    run_id = _ts()
-    run_log_path = LOGS_DIR / f"run_{run_id}.json"
-
-    run_log: Dict[str, Any] = {
-        "run_id": run_id,
-        "suite": {"name": suite.name, "description": suite.description},
-        "tests": [],
-    }
-
-    for test in suite.tests:
-        test_rec: Dict[str, Any] = {"name": test.name, "steps": [], "status": "PASS"}
-
-        safe_test_name = _safe_name(test.name)
-
-        for i, step in enumerate(test.steps, start=1):
-            rec = run_step(step, safe_test_name, i)
-            test_rec["steps"].append(rec)
-
-            # Auto screenshot after action steps (including tap_target now)
-            if step.type in {"launch_app", "tap", "tap_target", "input_text"}:
-                auto_path = SHOTS_DIR / f"{run_id}_{safe_test_name}_after_{i}.png"
-                try:
-                    adb.screenshot(auto_path)
-                    rec["auto_screenshot"] = str(auto_path)
-                except Exception as e:
-                    rec["auto_screenshot_error"] = str(e)
-
-            if not rec["ok"]:
-                test_rec["status"] = "FAIL"
-                break
-
-        run_log["tests"].append(test_rec)
-
+    run_log = StepEngine(suite, skip_rest_on_stop=True).run()
+    run_log_path = LOGS_DIR / f"run_{run_log['run_id']}.json"
     run_log_path.write_text(json.dumps(run_log, indent=2), encoding="utf-8")
     return run_log_path
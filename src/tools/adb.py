@@ -7,11 +7,44 @@ from pathlib import Path
 from typing import Optional
 
 
+# Bumped by every adb call that changes what is on screen. Lets callers
+# (e.g. the hierarchy prefetcher) tell cheaply whether the UI may have moved.
+_screen_generation = 0
+
+
+def _bump_generation() -> None:
+    global _screen_generation
+    _screen_generation += 1
+
+
+def screen_generation() -> int:
+    return _screen_generation
+
+
+# Serial every adb call in this process is pinned to (None = adb's default device).
+# One worker process drives one device; see src/tools/devicepool.py.
+_serial: Optional[str] = None
+
+
+def use_device(serial: Optional[str]) -> None:
+    global _serial
+    _serial = serial
+
+
+def current_device() -> Optional[str]:
+    return _serial
+
+
 def _run(cmd: list[str], timeout: int = 30) -> subprocess.CompletedProcess:
     """
     Runs a command and returns the CompletedProcess.
     Raises a RuntimeError if the command fails.
+    adb commands are pinned to the device selected with use_device().
     """
+    # only an explicit "adb -s <serial> ..." opts out; "-s" later on is an argument
+    if _serial and cmd[:1] == ["adb"] and cmd[1:2] != ["-s"]:
+        cmd = ["adb", "-s", _serial, *cmd[1:]]
+
     try:
         p = subprocess.run(
             cmd,
@@ -30,17 +63,50 @@ def _run(cmd: list[str], timeout: int = 30) -> subprocess.CompletedProcess:
     return p
 
 
+def stream(args: list[str]) -> subprocess.Popen:
+    """
+    Starts a long-running adb command (e.g. ["shell", "logcat", ...]) on the pinned
+    device and returns the Popen; read its stdout line by line, terminate() when done.
+    """
+    cmd = ["adb", *(["-s", _serial] if _serial else []), *args]
+    try:
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+    except Exception as e:
+        raise RuntimeError(f"Failed to run command: {cmd}\n{e}") from e
+
+
 def devices() -> str:
     return _run(["adb", "devices"]).stdout
 
 
+def parse_devices(out: str) -> dict[str, str]:
+    """
+    Parses `adb devices` output into {serial: state}, e.g. {"emulator-5554": "device"}.
+    """
+    result: dict[str, str] = {}
+    for ln in out.splitlines():
+        parts = ln.split()
+        if len(parts) >= 2 and not ln.startswith("List of devices"):
+            result[parts[0]] = parts[1]
+    return result
+
+
+def run_for_device(serial: str, args: list[str], timeout: int = 30) -> str:
+    """
+    Runs `adb -s <serial> ...` regardless of the pinned device. Returns STDOUT.
+    Example: run_for_device("emulator-5556", ["shell", "getprop", "sys.boot_completed"])
+    """
+    return _run(["adb", "-s", serial, *args], timeout=timeout).stdout
+
+
 def wait_for_device(timeout_sec: int = 60) -> None:
     start = time.time()
     while time.time() - start < timeout_sec:
-        out = devices()
-        # naive but works: look for "device" line that is not "List of devices"
-        lines = [ln.strip() for ln in out.splitlines() if ln.strip()]
-        ok = any(("device" in ln and "List of devices" not in ln and "offline" not in ln) for ln in lines)
+        states = parse_devices(devices())
+        if _serial:
+            ok = states.get(_serial) == "device"
+        else:
+            ok = any(state == "device" for state in states.values())
         if ok:
             return
         time.sleep(1)
@@ -50,24 +116,71 @@ def wait_for_device(timeout_sec: int = 60) -> None:
 def launch_app(package: str) -> None:
     # Most reliable launch method
     _run(["adb", "shell", "monkey", "-p", package, "-c", "android.intent.category.LAUNCHER", "1"])
+    _bump_generation()
 
 
 def tap(x: int, y: int) -> None:
     _run(["adb", "shell", "input", "tap", str(x), str(y)])
+    _bump_generation()
 
 
 def swipe(x1: int, y1: int, x2: int, y2: int, duration_ms: int = 300) -> None:
     _run(["adb", "shell", "input", "swipe", str(x1), str(y1), str(x2), str(y2), str(duration_ms)])
+    _bump_generation()
 
 
 def input_text(text: str) -> None:
     # Android "input text" needs spaces encoded as %s
     safe = text.replace(" ", "%s")
     _run(["adb", "shell", "input", "text", safe])
+    _bump_generation()
 
 
 def keyevent(keycode: int) -> None:
     _run(["adb", "shell", "input", "keyevent", str(keycode)])
+    _bump_generation()
+
+
+# Per-app locale each app had before the first set_app_locale() in this process
+_locales_before: dict[str, str] = {}
+
+
+def app_locale(package: str) -> str:
+    """
+    The app's per-app locale list ("" = follows the system), parsed from
+    "Locales for md.obsidian for user 0 are [de-DE]".
+    """
+    out = _run(["adb", "shell", "cmd", "locale", "get-app-locales", package]).stdout
+    if "[" in out and "]" in out:
+        return out[out.rindex("[") + 1 : out.rindex("]")].strip()
+    return ""
+
+
+def set_app_locale(package: str, locale: str) -> None:
+    """
+    Per-app language (Android 13+): the app's activities are recreated in `locale`.
+    No root or reboot needed, unlike changing the system locale.
+    The previous locale is remembered for restore_app_locales().
+    """
+    if package not in _locales_before:
+        _locales_before[package] = app_locale(package)
+    _run(["adb", "shell", "cmd", "locale", "set-app-locales", package, "--locales", locale])
+    _bump_generation()
+
+
+def restore_app_locales() -> bool:
+    """
+    Puts every app changed by set_app_locale() back to its previous locale.
+    Returns whether anything was restored.
+    """
+    if not _locales_before:
+        return False
+    for package, locales in list(_locales_before.items()):
+        # adb shell joins args into one command line: an empty arg must be quoted to survive
+        _run(["adb", "shell", "cmd", "locale", "set-app-locales", package, "--locales", locales or '""'])
+        del _locales_before[package]
+    _bump_generation()
+    return True
 
 
 def screenshot(local_path: str | Path, device_tmp_path: str = "/sdcard/__qa_tmp.png") -> Path:
@@ -105,5 +218,18 @@ def pull(remote_path: str, local_path: str | Path, timeout: int = 60) -> str:
 
 
 
+def focused_window() -> str:
+    """
+    Returns the window that currently has input focus, e.g.
+    "md.obsidian/md.obsidian.MainActivity". Much cheaper than a uiautomator dump,
+    so it is used as part of the screen fingerprint.
+    """
+    out = _run(["adb", "shell", "dumpsys", "window", "windows"]).stdout
+    for ln in out.splitlines():
+        if "mCurrentFocus" in ln:
+            return ln.split("=", 1)[-1].strip().rstrip("}").split(" ")[-1]
+    return ""
+
+
 def sleep(seconds: float) -> None:
     time.sleep(seconds)
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+# Fidelity levels, from most to least bytes kept
+FULL = "full"              # PNG as pulled from the device
+COMPRESSED = "compressed"  # downscaled, re-encoded as WebP/JPEG
+THUMBNAIL = "thumbnail"    # small thumbnail + hash of the original
+HASH = "hash"              # only the hash of the original, image deleted
+
+# Step record key -> capture kind the policy is keyed on
+CAPTURE_KINDS = {
+    "screenshot": "screenshot",     # explicit screenshot step: asserted evidence
+    "locate_screenshot": "locate",  # tap_target's frame before locating
+    "auto_screenshot": "auto",      # engine evidence after a screen change
+}
+
+
+@dataclass
+class CapturePolicy:
+    """
+    Which fidelity each kind of capture is kept at.
+    full_on_failure keeps every frame of a failed step at full fidelity.
+    """
+    name: str
+    by_kind: Dict[str, str] = field(default_factory=dict)
+    full_on_failure: bool = True
+    image_format: str = "webp"  # "webp" | "jpeg"
+    scale: float = 0.5
+    quality: int = 60
+    thumb_px: int = 240
+
+    def fidelity(self, kind: str, ok: bool) -> str:
+        if not ok and self.full_on_failure:
+            return FULL
+        return self.by_kind.get(kind, FULL)
+
+
+CAPTURE_POLICIES: Dict[str, CapturePolicy] = {
+    # everything as-is (previous behaviour)
+    "full": CapturePolicy("full"),
+    # debug frames downscaled + compressed
+    "compact": CapturePolicy("compact", by_kind={"locate": COMPRESSED, "auto": COMPRESSED}),
+    # debug frames only as thumbnail + hash, full image on failure only
+    "failure_only": CapturePolicy("failure_only", by_kind={"locate": THUMBNAIL, "auto": THUMBNAIL}),
+    # debug frames only as hash
+    "minimal": CapturePolicy("minimal", by_kind={"locate": HASH, "auto": HASH}),
+}
+
+
+def encode_capture(
+    src: str,
+    fidelity: str,
+    image_format: str = "webp",
+    scale: float = 0.5,
+    quality: int = 60,
+    thumb_px: int = 240,
+) -> Dict[str, Any]:
+    """
+    Re-encodes one captured PNG at the given fidelity (runs in a worker process).
+    Returns the kept path (None for hash-only), sha256 of the original and byte counts.
+    """
+    src_path = Path(src)
+    data = src_path.read_bytes()
+    info: Dict[str, Any] = {
+        "fidelity": fidelity,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "orig_bytes": len(data),
+    }
+
+    if fidelity == FULL:
+        info.update(path=str(src_path), bytes=len(data))
+        return info
+
+    if fidelity == HASH:
+        src_path.unlink()
+        info.update(path=None, bytes=0)
+        return info
+
+    from PIL import Image
+
+    ext = "jpg" if image_format == "jpeg" else image_format
+    with Image.open(src_path) as im:
+        im = im.convert("RGB")
+        if fidelity == THUMBNAIL:
+            im.thumbnail((thumb_px, thumb_px))
+            out_path = src_path.with_name(f"{src_path.stem}_thumb.{ext}")
+        else:
+            w, h = im.size
+            im = im.resize((max(1, int(w * scale)), max(1, int(h * scale))))
+            out_path = src_path.with_suffix(f".{ext}")
+        im.save(out_path, format=image_format.upper(), quality=quality)
+
+    src_path.unlink()
+    info.update(path=str(out_path), bytes=out_path.stat().st_size)
+    return info
+
+
+class CaptureEncoder:
+    """
+    Applies a CapturePolicy to the frames of finished steps in a process pool,
+    so PNG decode/encode does not contend for the GIL with the run loop.
+    finish() waits for all jobs and rewrites the step records' paths.
+    """
+
+    def __init__(self, policy: CapturePolicy, max_workers: Optional[int] = None):
+        self.policy = policy
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self._jobs: List[Tuple[Dict[str, Any], str, Future]] = []
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        """
+        Queues the frames of one step record (call once its ok/fail outcome is final).
+        """
+        for key, kind in CAPTURE_KINDS.items():
+            src = record.get(key)
+            if not src or not Path(src).exists():
+                continue
+            fidelity = self.policy.fidelity(kind, bool(record.get("ok")))
+            if fidelity == FULL:
+                continue
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self._max_workers)
+            future = self._pool.submit(
+                encode_capture,
+                src,
+                fidelity,
+                self.policy.image_format,
+                self.policy.scale,
+                self.policy.quality,
+                self.policy.thumb_px,
+            )
+            self._jobs.append((record, key, future))
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Waits for pending encodes, patches records, returns byte totals for the run log.
+        """
+        orig_total = 0
+        kept_total = 0
+        errors = 0
+        for record, key, future in self._jobs:
+            try:
+                info = future.result()
+            except Exception as e:
+                # keep the original frame if it could not be encoded (e.g. Pillow missing)
+                record.setdefault("captures", {})[key] = {"fidelity": FULL, "encode_error": str(e)}
+                errors += 1
+                continue
+            record[key] = info["path"]
+            record.setdefault("captures", {})[key] = {
+                "fidelity": info["fidelity"],
+                "sha256": info["sha256"],
+                "bytes": info["bytes"],
+            }
+            orig_total += info["orig_bytes"]
+            kept_total += info["bytes"]
+
+        self._jobs = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+        return {
+            "policy": self.policy.name,
+            "encoded_orig_bytes": orig_total,
+            "encoded_kept_bytes": kept_total,
+            "encode_errors": errors,
+        }
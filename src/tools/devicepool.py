@@ -0,0 +1,272 @@
+"""
+Warm pool of headless Android emulators.
+
+The pool boots N emulators once (snapshot boot, no window, no audio), health-checks
+them and leases them to workers, so cold boot drops out of the per-run critical path.
+Emulators already running on the pool's ports are adopted instead of booted, and
+shutdown(keep_warm=True) leaves them running for the next run.
+
+All device access goes through an AdbBackend, so the pool logic can be driven by
+a fake backend without Android.
+
+CLI:
+    python -m src.tools.devicepool up --avd Pixel_6_API_34 -n 3
+    python -m src.tools.devicepool status -n 3
+    python -m src.tools.devicepool down -n 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.tools import adb
+
+FIRST_PORT = 5554  # emulator console ports are even: 5554, 5556, ...
+
+
+def serial_for_port(port: int) -> str:
+    return f"emulator-{port}"
+
+
+class AdbBackend:
+    """
+    Real backend: talks to adb and the emulator binary.
+    Swap for a fake object with the same methods in tests.
+    """
+
+    def __init__(self, emulator_bin: Optional[str] = None):
+        self.emulator_bin = emulator_bin or _find_emulator_bin()
+
+    def list_devices(self) -> Dict[str, str]:
+        return adb.parse_devices(adb.devices())
+
+    def start_emulator(self, avd: str, port: int) -> None:
+        # Detached: the emulator outlives this process so it can stay warm between runs.
+        # No -no-snapshot-load, so it quick-boots from the AVD's snapshot;
+        # -no-snapshot-save keeps that snapshot clean.
+        subprocess.Popen(
+            [
+                self.emulator_bin,
+                "-avd", avd,
+                "-port", str(port),
+                "-no-window",
+                "-no-audio",
+                "-no-boot-anim",
+                "-no-snapshot-save",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def boot_completed(self, serial: str) -> bool:
+        try:
+            out = adb.run_for_device(serial, ["shell", "getprop", "sys.boot_completed"], timeout=10)
+        except RuntimeError:
+            return False
+        return out.strip() == "1"
+
+    def is_responsive(self, serial: str) -> bool:
+        try:
+            return adb.run_for_device(serial, ["shell", "echo", "ok"], timeout=10).strip() == "ok"
+        except RuntimeError:
+            return False
+
+    def kill_emulator(self, serial: str) -> None:
+        try:
+            adb.run_for_device(serial, ["emu", "kill"], timeout=15)
+        except RuntimeError:
+            pass
+
+
+def _find_emulator_bin() -> str:
+    found = shutil.which("emulator")
+    if found:
+        return found
+    sdk = os.environ.get("ANDROID_SDK_ROOT") or os.environ.get("ANDROID_HOME")
+    if sdk:
+        return os.path.join(sdk, "emulator", "emulator")
+    return "emulator"
+
+
+@dataclass
+class PooledDevice:
+    serial: str
+    port: int
+    avd: str
+    leased: bool = False
+    healthy: bool = False
+    boots: int = 0  # how many times the pool had to (re)boot it
+
+
+class DevicePool:
+    """
+    Boots/adopts `size` emulators of `avd` on consecutive even ports and leases them.
+    lease() blocks until a healthy device is free; release() hands it back.
+    """
+
+    def __init__(
+        self,
+        avd: str,
+        size: int = 1,
+        backend: Optional[AdbBackend] = None,
+        first_port: int = FIRST_PORT,
+        boot_timeout: float = 180.0,
+        kill_timeout: float = 60.0,
+        poll_interval: float = 1.0,
+    ):
+        self.avd = avd
+        self.backend = backend or AdbBackend()
+        self.boot_timeout = boot_timeout
+        self.kill_timeout = kill_timeout
+        self.poll_interval = poll_interval
+        self.devices: List[PooledDevice] = [
+            PooledDevice(serial=serial_for_port(first_port + 2 * i), port=first_port + 2 * i, avd=avd)
+            for i in range(size)
+        ]
+        self._cond = threading.Condition()
+
+    def start(self) -> None:
+        """
+        Adopts emulators already running on the pool's ports, boots the rest
+        (all boots in parallel), then waits until every device is healthy.
+        A port held by an emulator that is not usable (e.g. `offline`) is freed first.
+        """
+        running = self.backend.list_devices()
+        for dev in self.devices:
+            state = running.get(dev.serial)
+            if state == "device":
+                continue
+            if state is not None:
+                self._kill(dev)
+            self.backend.start_emulator(dev.avd, dev.port)
+            dev.boots += 1
+
+        for dev in self.devices:
+            self._wait_booted(dev)
+
+    def _wait_booted(self, dev: PooledDevice) -> None:
+        deadline = time.time() + self.boot_timeout
+        while time.time() < deadline:
+            if self.backend.list_devices().get(dev.serial) == "device" and self.backend.boot_completed(dev.serial):
+                dev.healthy = True
+                return
+            time.sleep(self.poll_interval)
+        dev.healthy = False
+        raise RuntimeError(f"Emulator {dev.serial} ({dev.avd}) did not boot within {self.boot_timeout}s")
+
+    def health_check(self, dev: PooledDevice) -> bool:
+        ok = (
+            self.backend.list_devices().get(dev.serial) == "device"
+            and self.backend.boot_completed(dev.serial)
+            and self.backend.is_responsive(dev.serial)
+        )
+        dev.healthy = ok
+        return ok
+
+    def _kill(self, dev: PooledDevice) -> None:
+        """
+        Kills the emulator and waits until adb no longer lists it: `adb emu kill`
+        returns before the emulator exits, and a new one on the same port (or a
+        boot check against the dying one) would collide with it.
+        """
+        dev.healthy = False
+        self.backend.kill_emulator(dev.serial)
+        deadline = time.time() + self.kill_timeout
+        while dev.serial in self.backend.list_devices():
+            if time.time() >= deadline:
+                raise RuntimeError(f"Emulator {dev.serial} did not exit within {self.kill_timeout}s")
+            time.sleep(self.poll_interval)
+
+    def _restart(self, dev: PooledDevice) -> None:
+        self._kill(dev)
+        self.backend.start_emulator(dev.avd, dev.port)
+        dev.boots += 1
+        self._wait_booted(dev)
+
+    def lease(self, timeout: Optional[float] = None) -> PooledDevice:
+        """
+        Returns a free device that passed a health check (restarting it if not).
+        Raises TimeoutError if none frees up within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                dev = next((d for d in self.devices if not d.leased), None)
+                if dev is not None:
+                    dev.leased = True
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No emulator free in the device pool")
+                self._cond.wait(remaining)
+
+        # health check outside the lock: a restart can take a while
+        try:
+            if not self.health_check(dev):
+                self._restart(dev)
+        except Exception:
+            self.release(dev)
+            raise
+        return dev
+
+    def release(self, dev: PooledDevice) -> None:
+        with self._cond:
+            dev.leased = False
+            self._cond.notify()
+
+    def status(self) -> List[Dict[str, object]]:
+        running = self.backend.list_devices()
+        return [
+            {
+                "serial": d.serial,
+                "avd": d.avd,
+                "state": running.get(d.serial, "absent"),
+                "leased": d.leased,
+                "boots": d.boots,
+            }
+            for d in self.devices
+        ]
+
+    def shutdown(self, keep_warm: bool = True) -> None:
+        """
+        keep_warm=True leaves the emulators running so the next run adopts them.
+        """
+        if keep_warm:
+            return
+        for dev in self.devices:
+            self.backend.kill_emulator(dev.serial)
+            dev.healthy = False
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage a warm pool of headless emulators")
+    parser.add_argument("cmd", choices=["up", "status", "down"])
+    parser.add_argument("--avd", default="", help="AVD name (required for 'up')")
+    parser.add_argument("-n", "--size", type=int, default=1)
+    parser.add_argument("--first-port", type=int, default=FIRST_PORT)
+    args = parser.parse_args(argv)
+
+    pool = DevicePool(args.avd, size=args.size, first_port=args.first_port)
+
+    if args.cmd == "up":
+        if not args.avd:
+            parser.error("'up' requires --avd")
+        pool.start()
+    elif args.cmd == "down":
+        pool.shutdown(keep_warm=False)
+
+    for row in pool.status():
+        print(f"{row['serial']}\t{row['state']}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,282 @@
+"""
+Device-side UI change signal over one persistent adb connection.
+
+A ScreenWatcher reads a continuous event stream from the device and keeps a
+live "screen generation" counter: every UI-change event bumps it. The hierarchy
+prefetcher uses it instead of a dumpsys call to tell whether the screen changed,
+and with a source that reports content changes (CONTENT_SOURCES) the engine stops
+waiting as soon as the screen has gone quiet after an action.
+
+Sources:
+- logcat: `logcat -b events` window/activity events. Always available, but only
+  sees window/activity level changes (not content inside one activity).
+- accessibility: `uiautomator events` accessibility events, including content
+  changes. On some Android versions it holds the UiAutomation connection and
+  blocks `uiautomator dump`, which every tap_target needs. start_watcher()
+  therefore probes a dump once the stream is up (first line read) and falls
+  back to logcat if the dump fails.
+
+Streams can be recorded and replayed offline:
+    python -m src.tools.events record --source logcat -o stream.txt
+    python -m src.tools.events replay --source logcat stream.txt
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.tools import adb
+
+# logcat -b events tags that mean "the window/activity on screen changed"
+_LOGCAT_UI_TAGS = {
+    "input_focus",
+    "wm_set_resumed_activity",
+    "wm_on_resume_called",
+    "wm_on_paused_called",
+    "wm_on_create_called",
+    "wm_on_top_resumed_gained_called",
+    "wm_task_moved",
+    "wm_focused_root_task",
+    "am_focused_root_task",
+    "am_focused_stack",
+    "am_resume_activity",
+    "am_pause_activity",
+}
+# e.g. "10-19 01:02:03.456  540  560 I input_focus: [...]"  or  "I/input_focus(  540): [...]"
+_LOGCAT_TAG_RE = re.compile(r"(?:^|\s)[VDIWEF][/ ]([a-z_]+)\s*[(:]")
+
+_ACCESSIBILITY_UI_TYPES = {
+    "TYPE_WINDOW_STATE_CHANGED",
+    "TYPE_WINDOW_CONTENT_CHANGED",
+    "TYPE_WINDOWS_CHANGED",
+    "TYPE_VIEW_SCROLLED",
+    "TYPE_VIEW_TEXT_CHANGED",
+}
+_ACCESSIBILITY_TYPE_RE = re.compile(r"EventType:\s*(TYPE_[A-Z_]+)")
+
+
+def parse_logcat_event(line: str) -> Optional[str]:
+    m = _LOGCAT_TAG_RE.search(line)
+    if m and m.group(1) in _LOGCAT_UI_TAGS:
+        return m.group(1)
+    return None
+
+
+def parse_accessibility_event(line: str) -> Optional[str]:
+    m = _ACCESSIBILITY_TYPE_RE.search(line)
+    if m and m.group(1) in _ACCESSIBILITY_UI_TYPES:
+        return m.group(1)
+    return None
+
+
+# Sources whose events include content changes inside a window, so "no events
+# for a while" means the screen is done rendering. logcat only says that the
+# window/activity changed, which happens before e.g. a WebView has drawn.
+CONTENT_SOURCES = {"accessibility"}
+
+# source name -> (adb args for the persistent stream, line parser)
+EVENT_SOURCES: Dict[str, Tuple[List[str], Callable[[str], Optional[str]]]] = {
+    "logcat": (["shell", "logcat", "-b", "events", "-v", "brief", "-T", "1"], parse_logcat_event),
+    "accessibility": (["shell", "uiautomator", "events"], parse_accessibility_event),
+}
+
+
+class ScreenWatcher:
+    """
+    Live screen generation counter fed by a device event stream (or a replayed one).
+    """
+
+    def __init__(self, source: str = "logcat"):
+        if source not in EVENT_SOURCES:
+            raise ValueError(f"Unknown event source: {source}")
+        self.source = source
+        self._args, self._parse = EVENT_SOURCES[source]
+        self.sees_content = source in CONTENT_SOURCES
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._last_event_at = 0.0
+        self.last_event: Optional[str] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        # set on the first stream line (or when the stream ends)
+        self._started = threading.Event()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def feed(self, line: str) -> Optional[str]:
+        """
+        Parses one stream line; bumps the generation if it is a UI change.
+        """
+        event = self._parse(line)
+        if event:
+            with self._cond:
+                self._generation += 1
+                self._last_event_at = time.monotonic()
+                self.last_event = event
+                self._cond.notify_all()
+        return event
+
+    def start(self) -> "ScreenWatcher":
+        """
+        Opens the persistent adb stream and reads it on a daemon thread.
+        """
+        self._proc = adb.stream(self._args)
+        self._thread = threading.Thread(target=self._read, name=f"screen_watcher_{self.source}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _read(self) -> None:
+        assert self._proc is not None and self._proc.stdout is not None
+        try:
+            for line in self._proc.stdout:
+                self._started.set()
+                self.feed(line)
+        finally:
+            self._started.set()
+
+    def wait_started(self, timeout: float) -> bool:
+        """
+        Blocks until the stream printed its first line (the device side is
+        connected) or ended. Returns False if nothing came within `timeout`.
+        """
+        return self._started.wait(timeout)
+
+    def replay(self, lines: Iterable[str]) -> List[int]:
+        """
+        Feeds recorded lines synchronously; returns the generation after each line.
+        """
+        generations: List[int] = []
+        for line in lines:
+            self.feed(line)
+            generations.append(self._generation)
+        return generations
+
+    def wait_quiet(self, since_generation: int, quiet_seconds: float, timeout: float) -> bool:
+        """
+        Blocks until the screen changed after `since_generation` and then saw no
+        events for `quiet_seconds`. Returns False if `timeout` ran out first
+        (e.g. the change produced no events from this source).
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    return False
+                if self._generation != since_generation:
+                    quiet_until = self._last_event_at + quiet_seconds
+                    if now >= quiet_until:
+                        return True
+                    self._cond.wait(min(quiet_until, deadline) - now)
+                else:
+                    self._cond.wait(deadline - now)
+
+    def stop(self) -> None:
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+
+
+# The watcher of this process, if one runs (read by the prefetcher's fingerprint)
+_active: Optional[ScreenWatcher] = None
+
+
+def set_active(watcher: Optional[ScreenWatcher]) -> None:
+    global _active
+    _active = watcher
+
+
+def active() -> Optional[ScreenWatcher]:
+    return _active
+
+
+# Sources that may hold the UiAutomation connection `uiautomator dump` needs
+DUMP_CONFLICTS = {"accessibility"}
+_PROBE_DEVICE_PATH = "/sdcard/__qa_probe_ui.xml"
+# How long start_watcher waits for the stream's first line before probing
+STARTUP_TIMEOUT = 5.0
+
+
+def hierarchy_dump_works(timeout: int = 15) -> bool:
+    """
+    Whether `uiautomator dump` succeeds right now (it prints "UI hierchary dumped to: ...").
+    """
+    try:
+        out = adb.shell(f"uiautomator dump {_PROBE_DEVICE_PATH}", timeout=timeout)
+    except RuntimeError:
+        return False
+    return "dumped to" in out
+
+
+def start_watcher(source: str) -> ScreenWatcher:
+    """
+    Starts a watcher for `source`. A source that blocks hierarchy dumps on this
+    device is stopped again and replaced by logcat (check watcher.source).
+    """
+    watcher = ScreenWatcher(source).start()
+    if source in DUMP_CONFLICTS:
+        # a probe before the stream holds its connection would always pass; a
+        # quiet screen may print nothing, so after the timeout probe anyway
+        watcher.wait_started(STARTUP_TIMEOUT)
+        if not hierarchy_dump_works():
+            watcher.stop()
+            print(f"Event source '{source}' blocks uiautomator dump on this device; using logcat instead")
+            watcher = ScreenWatcher("logcat").start()
+    return watcher
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Record or replay the device UI event stream")
+    parser.add_argument("cmd", choices=["record", "replay"])
+    parser.add_argument("path", nargs="?", help="Recorded stream (replay)")
+    parser.add_argument("--source", choices=sorted(EVENT_SOURCES), default="logcat")
+    parser.add_argument("-o", "--output", help="File to record to (record)")
+    parser.add_argument("--seconds", type=float, default=30.0, help="How long to record")
+    # intermixed: "replay --source logcat stream.txt" puts the path after the options
+    args = parser.parse_intermixed_args(argv)
+
+    if args.cmd == "record":
+        if not args.output:
+            parser.error("record requires -o/--output")
+        out = Path(args.output)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        proc = adb.stream(EVENT_SOURCES[args.source][0])
+        stop_at = time.monotonic() + args.seconds
+        timer = threading.Timer(args.seconds, proc.terminate)
+        timer.start()
+        with open(out, "w", encoding="utf-8") as f:
+            for line in proc.stdout:
+                f.write(line)
+                if time.monotonic() >= stop_at:
+                    break
+        timer.cancel()
+        proc.terminate()
+        print(f"Recorded {args.source} stream to {out}")
+        return
+
+    if not args.path:
+        parser.error("replay requires a path")
+    watcher = ScreenWatcher(args.source)
+    with open(args.path, "r", encoding="utf-8") as f:
+        for line in f:
+            event = watcher.feed(line)
+            if event:
+                print(f"gen={watcher.generation}\t{event}")
+    print(f"Final screen generation: {watcher.generation}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import heapq
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Dict, Any, Deque, List, Optional, Tuple
+
+from src.tools import runlog
+from src.tools.types import Step, TestCase
+
+# How many previous passing samples per step feed the rolling p95
+HISTORY_WINDOW = 20
+# from_logs reads at most this many of the newest run_*.json files
+MAX_JSON_RUNS = 200
+# Need at least this many samples before comparing against p95
+MIN_SAMPLES = 5
+# Slack over the historical p95 before a step counts as regressed
+P95_TOLERANCE = 1.25
+# ...and at least this much absolute slack, so jitter on very fast steps is ignored
+P95_MIN_SLACK_MS = 250.0
+
+
+def _step_key(test_name: str, step_type: str, description: str) -> Tuple[str, str, str]:
+    # Step records carry no index (retries repeat them), description is the stable handle
+    return test_name, step_type, description
+
+
+class LatencyHistory:
+    """
+    Rolling per-step (and per-test) durations from previous run logs.
+    """
+
+    def __init__(self, window: int = HISTORY_WINDOW):
+        self.window = window
+        self._steps: Dict[Tuple[str, str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._tests: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+
+    @classmethod
+    def from_logs(
+        cls,
+        paths: List[str | Path],
+        window: int = HISTORY_WINDOW,
+        max_json_runs: int = MAX_JSON_RUNS,
+    ) -> "LatencyHistory":
+        """
+        One streaming pass over run_*.json and/or compact logs.
+        Runs present in both formats are only counted once (see runlog.iter_events).
+        The window keeps the samples of the newest runs by run_id (a timestamp),
+        whatever order the files are read in. Only the newest `max_json_runs`
+        run_*.json files are read; compact files are streamed in full.
+        """
+        files = list(runlog.iter_log_files(paths))
+        json_files = sorted(p for p in files if not p.name.endswith(runlog.COMPACT_SUFFIX))
+        skipped = set(json_files[:-max_json_runs]) if max_json_runs else set()
+
+        # per key: min-heap of (run_id, seq, value), trimmed to the newest `window`
+        steps: Dict[Tuple[str, str, str], List[Tuple[str, int, float]]] = defaultdict(list)
+        tests: Dict[str, List[Tuple[str, int, float]]] = defaultdict(list)
+
+        def add(heap: List[Tuple[str, int, float]], item: Tuple[str, int, float]) -> None:
+            if len(heap) < window:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+        run_id = ""
+        seq = 0
+        test_name = ""
+        for kind, data in runlog.iter_events([p for p in files if p not in skipped]):
+            seq += 1
+            if kind == "run":
+                run_id = str(data.get("run_id") or "")
+            elif kind == "test":
+                test_name = data.get("name") or ""
+                if data.get("status") == "PASS" and data.get("duration_ms") is not None:
+                    add(tests[test_name], (run_id, seq, float(data["duration_ms"])))
+            elif kind == "step":
+                if data.get("ok") and data.get("duration_ms") is not None:
+                    key = _step_key(test_name, data.get("type", ""), data.get("description", ""))
+                    add(steps[key], (run_id, seq, float(data["duration_ms"])))
+
+        hist = cls(window)
+        for key, heap in steps.items():
+            hist._steps[key].extend(v for _, _, v in sorted(heap))
+        for name, heap in tests.items():
+            hist._tests[name].extend(v for _, _, v in sorted(heap))
+        return hist
+
+    def step_p95(self, test_name: str, step_type: str, description: str) -> Optional[float]:
+        samples = self._steps.get(_step_key(test_name, step_type, description))
+        if not samples or len(samples) < MIN_SAMPLES:
+            return None
+        return runlog.percentile(list(samples), 95)
+
+    def test_p95(self, test_name: str) -> Optional[float]:
+        samples = self._tests.get(test_name)
+        if not samples or len(samples) < MIN_SAMPLES:
+            return None
+        return runlog.percentile(list(samples), 95)
+
+
+def _check(duration_ms: float, budget_ms: Optional[float], p95_ms: Optional[float]) -> Dict[str, Any]:
+    breaches: List[str] = []
+    if budget_ms is not None and duration_ms > budget_ms:
+        breaches.append("budget")
+    if p95_ms is not None and duration_ms > max(p95_ms * P95_TOLERANCE, p95_ms + P95_MIN_SLACK_MS):
+        breaches.append("p95")
+    return {
+        "duration_ms": duration_ms,
+        "budget_ms": budget_ms,
+        "p95_ms": p95_ms,
+        "breaches": breaches,
+    }
+
+
+def check_step(
+    record: Dict[str, Any],
+    step: Step,
+    test_name: str,
+    history: Optional[LatencyHistory] = None,
+) -> None:
+    """
+    Compares the step's duration_ms against its YAML latency budget and the
+    historical p95 and stores the result in record["perf"].
+    Only passing steps are checked: a failed step is already a failure.
+    """
+    if not record.get("ok") or record.get("duration_ms") is None:
+        return
+    p95 = history.step_p95(test_name, step.type, step.description) if history else None
+    if step.latency_budget_ms is None and p95 is None:
+        return
+    record["perf"] = _check(record["duration_ms"], step.latency_budget_ms, p95)
+
+
+def check_test(
+    test_record: Dict[str, Any],
+    test: TestCase,
+    history: Optional[LatencyHistory] = None,
+) -> None:
+    """
+    Sums step durations (retries included) into test_record["duration_ms"] and
+    compares it against the test's duration SLO and historical p95.
+    """
+    total = round(sum(s.get("duration_ms") or 0.0 for s in test_record.get("steps", [])), 1)
+    test_record["duration_ms"] = total
+    if test_record.get("status") != "PASS":
+        return
+    p95 = history.test_p95(test.name) if history else None
+    if test.duration_slo_ms is None and p95 is None:
+        return
+    test_record["perf"] = _check(total, test.duration_slo_ms, p95)
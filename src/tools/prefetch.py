@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
+
+from src.tools import adb
+from src.tools import events
+from src.tools import vision
+
+# Separate device path so a prefetch dump never races the regular one at /sdcard/ui.xml
+PREFETCH_DEVICE_PATH = "/sdcard/__qa_prefetch_ui.xml"
+
+
+def screen_fingerprint() -> Tuple[int, str]:
+    """
+    Cheap identity of "the screen as it is now":
+    local count of screen-changing adb calls + the device-side screen generation
+    if a ScreenWatcher runs (free), else the focused window (one dumpsys call).
+    """
+    watcher = events.active()
+    if watcher is not None:
+        return adb.screen_generation(), f"{watcher.source}:{watcher.generation}"
+    return adb.screen_generation(), adb.focused_window()
+
+
+def prefetch_stats(counts: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Counts plus hit and waste rates; also used to sum up the shards of a fan-out run.
+    """
+    c = counts
+    lookups = c["hits"] + c["misses"] + c["stale"] + c["errors"]
+    wasted = c["stale"] + c["errors"] + c["unused"]
+    return {
+        **c,
+        "hit_rate": round(c["hits"] / lookups, 3) if lookups else 0.0,
+        "waste_rate": round(wasted / c["scheduled"], 3) if c["scheduled"] else 0.0,
+    }
+
+
+@dataclass
+class PrefetchedHierarchy:
+    root: ET.Element
+    xml_path: Path
+    fingerprint: Tuple[int, str]
+
+
+@dataclass
+class _Job:
+    future: Future
+    cancel: threading.Event
+
+
+class HierarchyPrefetcher:
+    """
+    Speculatively dumps + parses the UI hierarchy for an upcoming tap_target
+    in a background worker, while the current step is still acting/settling.
+
+    take() hands the result out only if the screen fingerprint still matches,
+    otherwise the caller falls back to a fresh dump. Hit and waste counts are
+    kept in self.counts and summarised by stats().
+    """
+
+    def __init__(
+        self,
+        out_dir: Path,
+        settle_seconds: float = 0.8,
+        wait_timeout: float = 10.0,
+        run_id: str = "",
+    ):
+        self.out_dir = Path(out_dir)
+        # prefixes the xml files, so a later run does not overwrite ones an older run log points to
+        self.run_id = run_id
+        self.settle_seconds = settle_seconds
+        self.wait_timeout = wait_timeout
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ui_prefetch")
+        self._jobs: Dict[str, _Job] = {}
+        self.counts: Dict[str, int] = {
+            "scheduled": 0,
+            "hits": 0,      # prefetched tree was used
+            "misses": 0,    # lookup with nothing prefetched
+            "stale": 0,     # prefetched, but screen changed since
+            "errors": 0,    # prefetch itself failed
+            "unused": 0,    # prefetched, never looked up
+        }
+
+    def _key(self, test_name: str, step_index: int) -> str:
+        return f"{test_name}::{step_index}"
+
+    def schedule(
+        self,
+        test_name: str,
+        step_index: int,
+        expect_change: bool,
+        settle_seconds: Optional[float] = None,
+        not_before: float = 0.0,
+    ) -> None:
+        """
+        Start prefetching the hierarchy that step (test_name, step_index) will see.
+        expect_change: the step running right now mutates the screen, so wait for
+        its action to land (screen generation moves) and settle before dumping.
+        settle_seconds overrides the default settle time (e.g. the running step's own).
+        not_before: time.monotonic() before which the screen is still settling from
+        earlier steps; the dump never starts earlier.
+        """
+        key = self._key(test_name, step_index)
+        if key in self._jobs:
+            return
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        prefix = f"{self.run_id}_" if self.run_id else ""
+        xml_path = self.out_dir / f"{prefix}{test_name}_prefetch_step{step_index}_ui.xml"
+        cancel = threading.Event()
+        start_gen = adb.screen_generation()
+
+        settle = self.settle_seconds if settle_seconds is None else settle_seconds
+        future = self._pool.submit(self._prefetch, xml_path, start_gen, expect_change, settle, not_before, cancel)
+        self._jobs[key] = _Job(future=future, cancel=cancel)
+        self.counts["scheduled"] += 1
+
+    def _prefetch(
+        self,
+        xml_path: Path,
+        start_gen: int,
+        expect_change: bool,
+        settle_seconds: float,
+        not_before: float,
+        cancel: threading.Event,
+    ) -> Optional[PrefetchedHierarchy]:
+        if expect_change:
+            deadline = time.time() + self.wait_timeout
+            while adb.screen_generation() == start_gen:
+                if cancel.is_set():
+                    return None
+                if time.time() > deadline:
+                    raise TimeoutError("Prefetch timeout: current step never changed the screen")
+                time.sleep(0.05)
+
+        # let the screen settle
+        if cancel.wait(max(0.0, not_before - time.monotonic()) + settle_seconds):
+            return None
+
+        fingerprint = screen_fingerprint()
+        root = vision.dump_hierarchy(xml_path, PREFETCH_DEVICE_PATH)
+        return PrefetchedHierarchy(root=root, xml_path=xml_path, fingerprint=fingerprint)
+
+    def take(self, test_name: str, step_index: int) -> Optional[PrefetchedHierarchy]:
+        """
+        Returns the prefetched hierarchy for this step if it is still valid, else None.
+        Blocks on an in-flight prefetch: finishing it is cheaper than starting a new dump.
+        """
+        job = self._jobs.pop(self._key(test_name, step_index), None)
+        if job is None:
+            self.counts["misses"] += 1
+            return None
+
+        try:
+            pre = job.future.result(timeout=self.wait_timeout + self.settle_seconds + 60)
+        except Exception:
+            self.counts["errors"] += 1
+            return None
+
+        if pre is None:
+            self.counts["errors"] += 1
+            return None
+
+        try:
+            current = screen_fingerprint()
+        except Exception:
+            self.counts["errors"] += 1
+            return None
+
+        if current != pre.fingerprint:
+            self.counts["stale"] += 1
+            return None
+
+        self.counts["hits"] += 1
+        return pre
+
+    def discard(self) -> None:
+        """
+        Drop every outstanding prefetch (e.g. after a failed step / retry,
+        when the planned screen sequence no longer holds).
+        """
+        for job in self._jobs.values():
+            job.cancel.set()
+            self.counts["unused"] += 1
+        self._jobs.clear()
+
+    def close(self) -> None:
+        self.discard()
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return prefetch_stats(self.counts)
@@ -0,0 +1,411 @@
+"""
+Compact run-log storage + streaming reporting.
+
+Compact format (*.jsonl.gz): gzip'd JSON lines, one run after another, so runs
+can be appended to a single file. Per run:
+
+    {"t": "run", "run_id": ..., "suite": {...}, "shots_dir": ..., "extra": {...}}
+    {"t": "str", "i": 0, "v": "Tap Create a vault"}       # string table entry
+    {"t": "test", "name": 3, "status": "PASS"}
+    {"t": "step", "s": {"type": 1, ...}, "v": {"ok": true, ...}}
+
+Repeated strings (descriptions, errors, supervisor reasons, test names) are
+interned: written once per run as a "str" line, then referenced by id under "s".
+Screenshot paths are stored relative to the run's "shots_dir"; a bare file
+name outside it is stored as "./name".
+
+CLI:
+    python -m src.tools.runlog convert artifacts/logs -o artifacts/logs/runs.jsonl.gz
+    python -m src.tools.runlog query artifacts/logs artifacts/logs/runs.jsonl.gz
+    python -m src.tools.runlog export artifacts/logs -o steps.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import gzip
+import json
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path, PurePosixPath
+from typing import Dict, Any, Iterator, List, Optional, Tuple, IO
+
+COMPACT_SUFFIX = ".jsonl.gz"
+
+# Step fields whose string values repeat a lot across steps/retries
+INTERN_KEYS = {
+    "type",
+    "description",
+    "error",
+    "failure_type",
+    "supervisor_action",
+    "supervisor_reason",
+    "used_target",
+}
+
+# Step fields holding screenshot / xml paths
+PATH_KEYS = {
+    "screenshot",
+    "locate_screenshot",
+    "after_tap_screenshot",
+    "auto_screenshot",
+    "prefetch_xml",
+}
+
+# Flat columns for `export`
+EXPORT_COLUMNS = [
+    "run_id",
+    "test",
+    "test_status",
+    "step_no",
+    "type",
+    "description",
+    "ok",
+    "failure_type",
+    "supervisor_action",
+    "duration_ms",
+    "error",
+]
+
+
+def _norm_path(p: str) -> str:
+    return p.replace("\\", "/")
+
+
+def _shots_dir(run_log: Dict[str, Any]) -> str:
+    """
+    Most common directory of the screenshot paths in a run (stored once per run).
+    """
+    dirs: Counter = Counter()
+    for test in run_log.get("tests", []):
+        for rec in test.get("steps", []):
+            for k in PATH_KEYS:
+                if isinstance(rec.get(k), str):
+                    dirs[str(PurePosixPath(_norm_path(rec[k])).parent)] += 1
+    return dirs.most_common(1)[0][0] if dirs else ""
+
+
+# ---------- write ----------
+
+def write_run(f: IO[str], run_log: Dict[str, Any]) -> None:
+    """
+    Writes one run (the dict main/orchestrator dump as JSON) in compact form.
+    String ids are scoped to the run, so runs can be appended independently.
+    """
+    shots_dir = _shots_dir(run_log)
+    extra = {k: v for k, v in run_log.items() if k not in ("run_id", "suite", "tests")}
+    header = {
+        "t": "run",
+        "run_id": run_log.get("run_id"),
+        "suite": run_log.get("suite"),
+        "shots_dir": shots_dir,
+        "extra": extra,
+    }
+    f.write(json.dumps(header, separators=(",", ":")) + "\n")
+
+    table: Dict[str, int] = {}
+
+    def intern(s: str) -> int:
+        if s not in table:
+            table[s] = len(table)
+            f.write(json.dumps({"t": "str", "i": table[s], "v": s}, separators=(",", ":")) + "\n")
+        return table[s]
+
+    for test in run_log.get("tests", []):
+        row = {"t": "test", "name": intern(test.get("name", "")), "status": test.get("status")}
+        extra = {k: v for k, v in test.items() if k not in ("name", "status", "steps")}
+        if extra:
+            row["v"] = extra
+        f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+        for rec in test.get("steps", []):
+            interned: Dict[str, int] = {}
+            values: Dict[str, Any] = {}
+            for k, v in rec.items():
+                if k in INTERN_KEYS and isinstance(v, str):
+                    interned[k] = intern(v)
+                elif k in PATH_KEYS and isinstance(v, str):
+                    p = PurePosixPath(_norm_path(v))
+                    if str(p.parent) == shots_dir:
+                        values[k] = p.name
+                    else:
+                        # a bare name outside shots_dir must not read back as relative to it
+                        values[k] = str(p) if "/" in str(p) else f"./{p}"
+                else:
+                    values[k] = v
+            row = {"t": "step", "s": interned, "v": values}
+            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+
+def append_run(path: str | Path, run_log: Dict[str, Any]) -> Path:
+    """
+    Appends one run to a compact log file (gzip members concatenate cleanly).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        write_run(f, run_log)
+    return path
+
+
+# ---------- read ----------
+
+# Events yielded by iter_events:
+#   ("run", header_dict)  ("test", test_record_without_steps)  ("step", step_record)
+
+def _events_from_json(path: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    run_log = json.loads(path.read_text(encoding="utf-8"))
+    header = {k: v for k, v in run_log.items() if k != "tests"}
+    yield "run", header
+    for test in run_log.get("tests", []):
+        yield "test", {k: v for k, v in test.items() if k != "steps"}
+        for rec in test.get("steps", []):
+            yield "step", rec
+
+
+def _events_from_compact(path: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    strings: List[str] = []
+    shots_dir = ""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            kind = row.get("t")
+
+            if kind == "run":
+                strings = []
+                shots_dir = row.get("shots_dir") or ""
+                header = {"run_id": row.get("run_id"), "suite": row.get("suite")}
+                header.update(row.get("extra") or {})
+                yield "run", header
+
+            elif kind == "str":
+                strings.append(row["v"])
+
+            elif kind == "test":
+                test = {"name": strings[row["name"]], "status": row.get("status")}
+                test.update(row.get("v") or {})
+                yield "test", test
+
+            elif kind == "step":
+                rec: Dict[str, Any] = {k: strings[i] for k, i in row.get("s", {}).items()}
+                for k, v in row.get("v", {}).items():
+                    if k in PATH_KEYS and isinstance(v, str):
+                        if v.startswith("./"):
+                            v = v[2:]
+                        elif "/" not in v and shots_dir not in ("", "."):
+                            v = f"{shots_dir}/{v}"
+                    rec[k] = v
+                yield "step", rec
+
+
+def iter_log_files(paths: List[str | Path]) -> Iterator[Path]:
+    """
+    Expands directories into their run_*.json and *.jsonl.gz files (sorted).
+    """
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            yield from sorted(p.glob("run_*.json"))
+            yield from sorted(p.glob(f"*{COMPACT_SUFFIX}"))
+        elif p.exists():
+            yield p
+
+
+def _events_from_file(path: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    if path.name.endswith(COMPACT_SUFFIX):
+        return _events_from_compact(path)
+    return _events_from_json(path)
+
+
+def iter_events(paths: List[str | Path]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    One streaming pass over legacy JSON logs and/or compact logs.
+    Only one legacy file is held in memory at a time.
+    A run stored more than once (e.g. as run_*.json and converted into a
+    *.jsonl.gz in the same directory) is only yielded the first time.
+    """
+    seen_runs = set()
+    skip = False
+    for path in iter_log_files(paths):
+        for kind, data in _events_from_file(path):
+            if kind == "run":
+                run_id = data.get("run_id")
+                skip = run_id is not None and run_id in seen_runs
+                seen_runs.add(run_id)
+            if not skip:
+                yield kind, data
+
+
+def iter_runs(paths: List[str | Path]) -> Iterator[Dict[str, Any]]:
+    """
+    Rebuilds full run-log dicts (same shape as run_*.json) from the event stream.
+    """
+    run: Optional[Dict[str, Any]] = None
+    for kind, data in iter_events(paths):
+        if kind == "run":
+            if run is not None:
+                yield run
+            run = dict(data)
+            run["tests"] = []
+        elif kind == "test" and run is not None:
+            test = {"name": data["name"], "steps": [], "status": data["status"]}
+            test.update({k: v for k, v in data.items() if k not in test})
+            run["tests"].append(test)
+        elif kind == "step" and run is not None and run["tests"]:
+            run["tests"][-1]["steps"].append(data)
+    if run is not None:
+        yield run
+
+
+# ---------- report ----------
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[idx]
+
+
+class RunStats:
+    """
+    Folds the event stream into pass rate, per-step-type latency,
+    per-day step failure-type counts and per-day counts of tests that
+    passed over their duration budget.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.tests = 0
+        self.tests_passed = 0
+        self.steps = 0
+        self.steps_failed = 0
+        self.latency_ms: Dict[str, List[float]] = defaultdict(list)
+        self.failures_by_day: Dict[str, Counter] = defaultdict(Counter)
+        # test-level PERF_REGRESSION, kept apart from the per-step counts
+        self.slow_tests_by_day: Counter = Counter()
+        self._day = "unknown"
+
+    def add(self, kind: str, data: Dict[str, Any]) -> None:
+        if kind == "run":
+            self.runs += 1
+            run_id = str(data.get("run_id") or "")
+            self._day = run_id.split("_", 1)[0] or "unknown"
+        elif kind == "test":
+            self.tests += 1
+            if data.get("status") == "PASS":
+                self.tests_passed += 1
+                # passed, but over its duration SLO / p95 (Supervisor.review_test)
+                if data.get("failure_type") == "PERF_REGRESSION":
+                    self.slow_tests_by_day[self._day] += 1
+        elif kind == "step":
+            self.steps += 1
+            if not data.get("ok", False):
+                self.steps_failed += 1
+                self.failures_by_day[self._day][data.get("failure_type") or "UNCLASSIFIED"] += 1
+            elif data.get("failure_type") == "PERF_REGRESSION":
+                self.failures_by_day[self._day]["PERF_REGRESSION"] += 1
+            if data.get("duration_ms") is not None:
+                self.latency_ms[data.get("type", "?")].append(float(data["duration_ms"]))
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "tests": self.tests,
+            "test_pass_rate": round(self.tests_passed / self.tests, 3) if self.tests else None,
+            "steps": self.steps,
+            "step_failure_rate": round(self.steps_failed / self.steps, 3) if self.steps else None,
+            "step_latency_ms": {
+                t: {
+                    "count": len(v),
+                    "p50": percentile(v, 50),
+                    "p95": percentile(v, 95),
+                    "max": max(v),
+                }
+                for t, v in sorted(self.latency_ms.items())
+            },
+            "failure_types_by_day": {d: dict(c) for d, c in sorted(self.failures_by_day.items())},
+            "test_perf_regressions_by_day": dict(sorted(self.slow_tests_by_day.items())),
+        }
+
+
+def query(paths: List[str | Path]) -> Dict[str, Any]:
+    stats = RunStats()
+    for kind, data in iter_events(paths):
+        stats.add(kind, data)
+    return stats.report()
+
+
+# ---------- CLI ----------
+
+def _cmd_convert(args: argparse.Namespace) -> None:
+    out = Path(args.output)
+    if out.exists() and not args.append:
+        out.unlink()
+    # skip the output file itself if it lives in a scanned directory
+    sources = [p for p in iter_log_files(args.paths) if p.resolve() != out.resolve()]
+    n = 0
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(out, "at", encoding="utf-8") as f:
+        for run in iter_runs(sources):
+            write_run(f, run)
+            n += 1
+    print(f"Converted {n} runs into {out}")
+
+
+def _cmd_query(args: argparse.Namespace) -> None:
+    print(json.dumps(query(args.paths), indent=2))
+
+
+def _cmd_export(args: argparse.Namespace) -> None:
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=EXPORT_COLUMNS)
+        w.writeheader()
+        run_id, test, status, step_no = None, None, None, 0
+        for kind, data in iter_events(args.paths):
+            if kind == "run":
+                run_id = data.get("run_id")
+            elif kind == "test":
+                test, status, step_no = data.get("name"), data.get("status"), 0
+            elif kind == "step":
+                step_no += 1
+                w.writerow({
+                    "run_id": run_id,
+                    "test": test,
+                    "test_status": status,
+                    "step_no": step_no,
+                    **{k: data.get(k) for k in EXPORT_COLUMNS[4:]},
+                })
+    print(f"Exported step rows to {out}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compact, convert and query run logs")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("convert", help="Convert run_*.json logs into one compact .jsonl.gz")
+    p.add_argument("paths", nargs="+", help="Log files or directories")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--append", action="store_true", help="Append instead of overwriting the output")
+    p.set_defaults(func=_cmd_convert)
+
+    p = sub.add_parser("query", help="Pass rate, step latency and failure trends (single pass)")
+    p.add_argument("paths", nargs="+", help="Log files or directories")
+    p.set_defaults(func=_cmd_query)
+
+    p = sub.add_parser("export", help="Flat one-row-per-step CSV for external tools")
+    p.add_argument("paths", nargs="+", help="Log files or directories")
+    p.add_argument("-o", "--output", required=True)
+    p.set_defaults(func=_cmd_export)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, Optional
+
+from src.tools.types import Step
+
+
+@dataclass
+class StepContext:
+    """
+    What a handler gets besides the step itself.
+    """
+    test_name: str          # already file-name safe
+    step_index: int
+    prefetcher: Any = None  # Optional[HierarchyPrefetcher]
+    artifact_tag: str = ""  # set when several devices share the artifacts dir
+
+
+# A handler performs the action and fills in the record; it raises on failure.
+HandlerFunc = Callable[[Step, StepContext, Dict[str, Any]], None]
+
+
+@dataclass(frozen=True)
+class StepHandler:
+    """
+    A step type plus what it does to the device, so the engine can decide
+    when a capture, cache invalidation or settle wait is actually needed.
+    """
+    type: str
+    func: HandlerFunc
+    observes_screen: bool = False  # reads the UI (takes its own screenshot / hierarchy)
+    mutates_screen: bool = False   # changes the UI (captures/caches from before are stale)
+    settle_seconds: float = 0.0    # how long the UI needs after the action before it is trusted
+
+
+STEP_HANDLERS: Dict[str, StepHandler] = {}
+
+
+def step_handler(
+    step_type: str,
+    observes_screen: bool = False,
+    mutates_screen: bool = False,
+    settle_seconds: float = 0.0,
+) -> Callable[[HandlerFunc], HandlerFunc]:
+    """
+    Decorator registering a handler for a YAML step type:
+
+        @step_handler("tap", mutates_screen=True, settle_seconds=0.7)
+        def _tap(step, ctx, record): ...
+    """
+    def register(func: HandlerFunc) -> HandlerFunc:
+        STEP_HANDLERS[step_type] = StepHandler(
+            type=step_type,
+            func=func,
+            observes_screen=observes_screen,
+            mutates_screen=mutates_screen,
+            settle_seconds=settle_seconds,
+        )
+        return func
+
+    return register
+
+
+def get_handler(step_type: str) -> Optional[StepHandler]:
+    return STEP_HANDLERS.get(step_type)
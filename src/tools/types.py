@@ -1,7 +1,10 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
+import bisect
+import queue
+import re
+from dataclasses import dataclass, field, replace
+from typing import Optional, List, Dict, Any, Iterator, Sequence, Tuple
 
 
 @dataclass
@@ -20,19 +23,204 @@ class Step:
     alt_target: Optional[str] = None      # fallback target text ("Create new vault")
     hint: Optional[str] = None            # extra hint for locator if needed
     keycode: Optional[int] = None
+    # BCP 47 tag for set_locale, e.g. "de-DE"
+    locale: Optional[str] = None
+    # Perf: step is flagged if it takes longer than this
+    latency_budget_ms: Optional[float] = None
 
 
 @dataclass
 class TestCase:
     name: str
     steps: List[Step]
+    # Perf: total test duration (all steps, retries included) it should stay under
+    duration_slo_ms: Optional[float] = None
+    # Data-driven: {"title": ["A", "B"], ...}; steps use "{title}" placeholders
+    matrix: Optional[Dict[str, List[Any]]] = None
+    # Leading steps that are the YAML `setup:` block. For matrix instances the
+    # planner skips them when the previous instance on the device passed.
+    setup_steps: int = 0
+    # Set on expanded matrix instances
+    template: Optional[str] = None
+    params: Optional[Dict[str, Any]] = None
 
 
 @dataclass
 class TestSuite:
     name: str
     description: str
-    tests: List[TestCase]
+    tests: Sequence[TestCase]
+    # Tests as written in the YAML (matrix tests unexpanded)
+    templates: List[TestCase] = field(default_factory=list)
+
+    def worker_share(self, work: "queue.Queue", run_plain: bool) -> "TestSuite":
+        """
+        One fan-out worker's view of the suite: the plain tests in order if
+        run_plain (they are one dependent flow, so only one device runs them),
+        then matrix instances claimed from the shared `work` queue of
+        (template index, combo) items (see matrix_work) as the worker gets to them.
+        """
+        return TestSuite(
+            name=self.name,
+            description=self.description,
+            tests=QueuedTests(self.templates, work, run_plain),
+            templates=self.templates,
+        )
+
+
+# ---------- matrix expansion ----------
+
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+_STEP_TEXT_FIELDS = ("description", "text", "app", "path", "target", "alt_target", "hint", "locale")
+
+
+def _fill(value: Optional[str], params: Dict[str, Any]) -> Optional[str]:
+    # only known params are replaced, other braces are left alone
+    if value is None:
+        return None
+    return _PLACEHOLDER_RE.sub(lambda m: str(params[m.group(1)]) if m.group(1) in params else m.group(0), value)
+
+
+def matrix_size(test: TestCase) -> int:
+    size = 1
+    for values in (test.matrix or {}).values():
+        size *= len(values)
+    return size
+
+
+def matrix_params(test: TestCase, combo: int) -> Dict[str, Any]:
+    """
+    Parameters of instance number `combo` (mixed-radix over the matrix, last key fastest).
+    """
+    params: Dict[str, Any] = {}
+    for key, values in reversed(list((test.matrix or {}).items())):
+        combo, i = divmod(combo, len(values))
+        params[key] = values[i]
+    return dict(reversed(list(params.items())))
+
+
+def instantiate(test: TestCase, params: Dict[str, Any]) -> TestCase:
+    # instance names must be unique: append params the name does not mention
+    named = {m.group(1) for m in _PLACEHOLDER_RE.finditer(test.name)}
+    rest = [f"{k}={v}" for k, v in params.items() if k not in named]
+    name = _fill(test.name, params) + (f" [{', '.join(rest)}]" if rest else "")
+    steps = [
+        replace(step, **{f: _fill(getattr(step, f), params) for f in _STEP_TEXT_FIELDS})
+        for step in test.steps
+    ]
+    return TestCase(
+        name=name,
+        steps=steps,
+        duration_slo_ms=test.duration_slo_ms,
+        setup_steps=test.setup_steps,
+        template=test.name,
+        params=params,
+    )
+
+
+def iter_instances(test: TestCase) -> Iterator[TestCase]:
+    """
+    Lazily yields every instance of a matrix test.
+    """
+    if not test.matrix:
+        yield test
+        return
+    for combo in range(matrix_size(test)):
+        yield instantiate(test, matrix_params(test, combo))
+
+
+def matrix_work(templates: List[TestCase]) -> Iterator[Tuple[int, int]]:
+    """
+    (template index, combo) of every matrix instance, in suite order: the work
+    items fan-out workers claim from a shared queue.
+    """
+    for i, t in enumerate(templates):
+        if t.matrix:
+            for combo in range(matrix_size(t)):
+                yield i, combo
+
+
+class ExpandedTests(Sequence[TestCase]):
+    """
+    Read-only, lazily expanded view of a suite's tests: matrix instances are
+    only built when indexed.
+    """
+
+    def __init__(self, templates: List[TestCase]):
+        # blocks of (template, first combo, last combo + 1)
+        self._blocks: List[Tuple[TestCase, int, int]] = [
+            (t, 0, matrix_size(t) if t.matrix else 1) for t in templates
+        ]
+
+        self._starts: List[int] = []
+        total = 0
+        for _, start, stop in self._blocks:
+            self._starts.append(total)
+            total += stop - start
+        self._len = total
+        self._cache: Dict[int, TestCase] = {}
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._len))]
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+
+        if i not in self._cache:
+            b = bisect.bisect_right(self._starts, i) - 1
+            test, start, _ = self._blocks[b]
+            if not test.matrix:
+                self._cache[i] = test
+            else:
+                offset = i - self._starts[b]
+                self._cache[i] = instantiate(test, matrix_params(test, start + offset))
+            # planner walks forward; keep only a small window
+            if len(self._cache) > 8:
+                self._cache.pop(next(iter(self._cache)))
+        return self._cache[i]
+
+
+class QueuedTests(Sequence[TestCase]):
+    """
+    A fan-out worker's tests (see TestSuite.worker_share). Matrix instances are
+    claimed from the shared queue on demand; one instance beyond the last one
+    asked for is kept claimed, so len() can tell the planner whether more follow.
+    """
+
+    def __init__(self, templates: List[TestCase], work: "queue.Queue", run_plain: bool):
+        self._templates = templates
+        self._work = work
+        self._tests: List[TestCase] = [t for t in templates if not t.matrix] if run_plain else []
+        self._hi = -1  # highest index asked for
+        self._exhausted = False
+
+    def _claim_until(self, n: int) -> None:
+        while len(self._tests) < n and not self._exhausted:
+            try:
+                t_i, combo = self._work.get_nowait()
+            except queue.Empty:
+                self._exhausted = True
+                return
+            template = self._templates[t_i]
+            self._tests.append(instantiate(template, matrix_params(template, combo)))
+
+    def __len__(self) -> int:
+        self._claim_until(self._hi + 2)
+        return len(self._tests)
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            raise TypeError("QueuedTests does not support slicing")
+        if i < 0:
+            raise IndexError(i)
+        self._hi = max(self._hi, i)
+        self._claim_until(i + 1)
+        return self._tests[i]
 
 
 def _req(d: Dict[str, Any], key: str) -> Any:
@@ -41,6 +229,28 @@ def _req(d: Dict[str, Any], key: str) -> Any:
     return d[key]
 
 
+def _parse_step(s: Dict[str, Any]) -> Step:
+    stype = _req(s, "type")
+    sdesc = _req(s, "description")
+
+    return Step(
+        type=stype,
+        description=sdesc,
+        x=s.get("x"),
+        y=s.get("y"),
+        text=s.get("text"),
+        app=s.get("app"),
+        path=s.get("path"),
+        sleep_seconds=s.get("sleep_seconds"),
+        target=s.get("target"),
+        alt_target=s.get("alt_target"),
+        hint=s.get("hint"),
+        keycode=s.get("keycode"),
+        locale=s.get("locale"),
+        latency_budget_ms=s.get("latency_budget_ms"),
+    )
+
+
 def parse_suite(data: Dict[str, Any]) -> TestSuite:
     suite_meta = _req(data, "test_suite")
     tests_data = _req(data, "tests")
@@ -51,28 +261,25 @@ def parse_suite(data: Dict[str, Any]) -> TestSuite:
     tests: List[TestCase] = []
     for t in tests_data:
         tname = _req(t, "name")
-        steps_list = _req(t, "steps")
-        steps: List[Step] = []
-        for s in steps_list:
-            stype = _req(s, "type")
-            sdesc = _req(s, "description")
-
-            steps.append(
-                Step(
-                    type=stype,
-                    description=sdesc,
-                    x=s.get("x"),
-                    y=s.get("y"),
-                    text=s.get("text"),
-                    app=s.get("app"),
-                    path=s.get("path"),
-                    sleep_seconds=s.get("sleep_seconds"),
-                    target=s.get("target"),
-                    alt_target=s.get("alt_target"),
-                    hint=s.get("hint"),
-                    keycode=s.get("keycode"),
-                )
+        setup = [_parse_step(s) for s in t.get("setup") or []]
+        steps = setup + [_parse_step(s) for s in _req(t, "steps")]
+        matrix = t.get("matrix")
+        if matrix is not None:
+            if not isinstance(matrix, dict) or not all(isinstance(v, list) and v for v in matrix.values()):
+                raise ValueError(f"'matrix' must map names to non-empty lists in test: {tname}")
+        tests.append(
+            TestCase(
+                name=tname,
+                steps=steps,
+                duration_slo_ms=t.get("duration_slo_ms"),
+                matrix=matrix,
+                setup_steps=len(setup),
             )
-        tests.append(TestCase(name=tname, steps=steps))
+        )
 
-    return TestSuite(name=suite_name, description=suite_desc, tests=tests)
+    return TestSuite(
+        name=suite_name,
+        description=suite_desc,
+        tests=ExpandedTests(tests),
+        templates=tests,
+    )
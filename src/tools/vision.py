@@ -115,40 +115,48 @@ def _find_edittext_below_label(root: ET.Element, label: str) -> Optional[Tuple[i
     return best
 
 
+def dump_hierarchy(local_xml: Path, dump_device_path: str = "/sdcard/ui.xml") -> ET.Element:
+    """
+    Dumps the current UI hierarchy, pulls it to local_xml and parses it.
+    adb failures propagate as RuntimeError; a missing or unparsable xml raises ValueError.
+    """
+    adb.shell(f"uiautomator dump {dump_device_path}")
+    adb.pull(dump_device_path, local_xml)
+
+    if not Path(local_xml).exists():
+        raise ValueError("UI xml was not pulled successfully")
+
+    try:
+        return ET.parse(local_xml).getroot()
+    except Exception as e:
+        raise ValueError(f"Failed to parse UI xml: {e}") from e
+
+
 def locate_tap_point(
     screenshot_path: Path,
     target: str,
     hint: Optional[str] = None,
+    root: Optional[ET.Element] = None,
 ) -> Dict[str, Any]:
     """
     Offline locator using UIAutomator XML.
     1) exact match on common attributes (text/content-desc/resource-id/hint-like)
     2) fallback: if target looks like a label, tap nearest EditText below it
     3) fallback: if hint is provided, try matching hint too
-    """
 
-    dump_device_path = "/sdcard/ui.xml"
-    adb.shell(f"uiautomator dump {dump_device_path}")
-
-    local_xml = screenshot_path.parent / (screenshot_path.stem + "_ui.xml")
-    adb.pull(dump_device_path, local_xml)
-
-    if not local_xml.exists():
-        return {
-            "found": False,
-            "reason": "UI xml was not pulled successfully",
-            "method": "uiautomator_xml",
-        }
+    If root is given (an already dumped/prefetched hierarchy), no new dump is taken.
+    """
 
-    try:
-        tree = ET.parse(local_xml)
-        root = tree.getroot()
-    except Exception as e:
-        return {
-            "found": False,
-            "reason": f"Failed to parse UI xml: {e}",
-            "method": "uiautomator_xml",
-        }
+    if root is None:
+        local_xml = screenshot_path.parent / (screenshot_path.stem + "_ui.xml")
+        try:
+            root = dump_hierarchy(local_xml)
+        except ValueError as e:
+            return {
+                "found": False,
+                "reason": str(e),
+                "method": "uiautomator_xml",
+            }
 
     # 1) Exact match on target
     matches = _find_exact_matches(root, target)
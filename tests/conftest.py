@@ -0,0 +1,67 @@
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from src.tools import adb
+
+HIERARCHY = (
+    '<?xml version="1.0"?><hierarchy>'
+    '<node text="{text}" clickable="true" bounds="[0,0][100,100]"/>'
+    "</hierarchy>"
+)
+
+
+class FakeDevice:
+    """
+    Stands in for adb: records every command (with the time it ran) and
+    answers the few commands whose output the code reads.
+    """
+
+    def __init__(self):
+        self.calls = []               # (time.monotonic(), args after "adb [-s serial]")
+        self.focus = "md.obsidian/md.obsidian.MainActivity"
+        self.screen_text = "Create a vault"
+        self.fail = set()             # substrings of commands that should fail
+
+    def run(self, cmd, **kwargs):
+        args = cmd[1:]
+        if args[:1] == ["-s"]:
+            args = args[2:]
+        self.calls.append((time.monotonic(), args))
+        line = " ".join(args)
+        if any(f in line for f in self.fail):
+            return subprocess.CompletedProcess(cmd, 1, "", f"fake failure: {line}")
+
+        out = ""
+        if args[:1] == ["devices"]:
+            out = "List of devices attached\nemulator-5554\tdevice\n"
+        elif args[:1] == ["pull"]:
+            dst = Path(args[2])
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if args[1].endswith(".xml"):
+                dst.write_text(HIERARCHY.format(text=self.screen_text), encoding="utf-8")
+            else:
+                dst.write_bytes(b"\x89PNG fake")
+        elif "dumpsys" in args:
+            out = f"  mCurrentFocus=Window{{abc u0 {self.focus}}}\n"
+        return subprocess.CompletedProcess(cmd, 0, out, "")
+
+    def commands(self, *prefix):
+        """
+        Recorded commands starting with `prefix`, e.g. commands("shell", "input").
+        """
+        return [args for _, args in self.calls if tuple(args[: len(prefix)]) == prefix]
+
+    def times(self, *prefix):
+        return [t for t, args in self.calls if tuple(args[: len(prefix)]) == prefix]
+
+
+@pytest.fixture
+def fake_adb(monkeypatch, tmp_path):
+    device = FakeDevice()
+    monkeypatch.setattr(adb.subprocess, "run", device.run)
+    # artifacts/ is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return device
@@ -0,0 +1,53 @@
+import subprocess
+
+import pytest
+
+from src.tools import adb
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    ran = []
+
+    def fake_run(cmd, **kwargs):
+        ran.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(adb.subprocess, "run", fake_run)
+    adb.use_device("emulator-5556")
+    yield ran
+    adb.use_device(None)
+
+
+def test_commands_are_pinned_to_the_device(commands):
+    adb.tap(1, 2)
+    assert commands[-1] == ["adb", "-s", "emulator-5556", "shell", "input", "tap", "1", "2"]
+
+
+def test_dash_s_argument_does_not_unpin(commands):
+    adb.input_text("-s")
+    adb.shell("ls -s /sdcard")
+    assert commands[0] == ["adb", "-s", "emulator-5556", "shell", "input", "text", "-s"]
+    assert commands[1] == ["adb", "-s", "emulator-5556", "shell", "ls", "-s", "/sdcard"]
+
+
+def test_explicit_serial_wins(commands):
+    adb.run_for_device("emulator-5558", ["shell", "echo", "ok"])
+    assert commands[-1] == ["adb", "-s", "emulator-5558", "shell", "echo", "ok"]
+
+
+def test_app_locale_is_restored(commands, monkeypatch):
+    def fake_run(cmd, **kwargs):
+        commands.append(cmd)
+        out = "Locales for md.obsidian for user 0 are []\n" if "get-app-locales" in cmd else ""
+        return subprocess.CompletedProcess(cmd, 0, out, "")
+
+    monkeypatch.setattr(adb.subprocess, "run", fake_run)
+    adb.set_app_locale("md.obsidian", "de-DE")
+    adb.set_app_locale("md.obsidian", "ja-JP")
+
+    assert adb.restore_app_locales()
+    assert commands[-1][-5:] == ["locale", "set-app-locales", "md.obsidian", "--locales", '""']
+    # only looked up before the first change
+    assert sum("get-app-locales" in c for c in commands) == 1
+    assert not adb.restore_app_locales()
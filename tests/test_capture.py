@@ -0,0 +1,41 @@
+import hashlib
+
+import pytest
+
+from src.tools.capture import COMPRESSED, FULL, HASH, THUMBNAIL, encode_capture
+
+
+@pytest.fixture
+def png(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    path = tmp_path / "t_step1.png"
+    Image.new("RGB", (400, 800), (30, 120, 200)).save(path)
+    return path
+
+
+def test_full_keeps_the_png(png):
+    info = encode_capture(str(png), FULL)
+
+    assert info["path"] == str(png) and png.exists()
+    assert info["bytes"] == info["orig_bytes"]
+
+
+@pytest.mark.parametrize("fidelity, suffix, size", [(COMPRESSED, ".webp", (200, 400)), (THUMBNAIL, "_thumb.webp", (120, 240))])
+def test_reencoded_frame_replaces_the_png(png, fidelity, suffix, size):
+    from PIL import Image
+
+    sha = hashlib.sha256(png.read_bytes()).hexdigest()
+    info = encode_capture(str(png), fidelity, image_format="webp", scale=0.5, thumb_px=240)
+
+    assert not png.exists()
+    assert info["path"].endswith(f"t_step1{suffix}")
+    assert info["sha256"] == sha
+    with Image.open(info["path"]) as im:
+        assert im.size == size
+
+
+def test_hash_only_deletes_the_frame(png):
+    info = encode_capture(str(png), HASH)
+
+    assert not png.exists()
+    assert info["path"] is None and info["bytes"] == 0
@@ -0,0 +1,154 @@
+import threading
+
+import pytest
+
+from src.tools.devicepool import DevicePool, serial_for_port
+
+
+class FakeEmulator:
+    def __init__(self, boot_polls=2, exit_polls=2, state="booting"):
+        self.state = state            # "booting" | "device" | "offline" | "dying"
+        self.boot_polls = boot_polls  # list_devices() polls until booted
+        self.exit_polls = exit_polls  # polls a killed emulator stays listed
+        self.responsive = True
+
+
+class FakeBackend:
+    """
+    Emulators that take a few list_devices() polls to boot, and that keep being
+    listed as healthy for a few polls after `emu kill` (like the real ones).
+    """
+
+    def __init__(self, boot_polls=2, exit_polls=2):
+        self.boot_polls = boot_polls
+        self.exit_polls = exit_polls
+        self.emulators = {}
+        self.started = []
+        self.killed = []
+        self.collisions = []
+
+    def add_running(self, port, state="device"):
+        self.emulators[serial_for_port(port)] = FakeEmulator(0, self.exit_polls, state)
+
+    def list_devices(self):
+        states = {}
+        for serial, emu in list(self.emulators.items()):
+            if emu.state == "booting":
+                emu.boot_polls -= 1
+                if emu.boot_polls <= 0:
+                    emu.state = "device"
+                states[serial] = "offline"
+            elif emu.state == "dying":
+                emu.exit_polls -= 1
+                if emu.exit_polls < 0:
+                    del self.emulators[serial]
+                    continue
+                states[serial] = "device"  # still answers while shutting down
+            else:
+                states[serial] = emu.state
+        return states
+
+    def start_emulator(self, avd, port):
+        serial = serial_for_port(port)
+        self.started.append(serial)
+        if serial in self.emulators:
+            self.collisions.append(serial)
+            return
+        self.emulators[serial] = FakeEmulator(self.boot_polls, self.exit_polls)
+
+    def boot_completed(self, serial):
+        emu = self.emulators.get(serial)
+        return emu is not None and emu.state in ("device", "dying")
+
+    def is_responsive(self, serial):
+        emu = self.emulators.get(serial)
+        return emu is not None and emu.state == "device" and emu.responsive
+
+    def kill_emulator(self, serial):
+        self.killed.append(serial)
+        if serial in self.emulators:
+            self.emulators[serial].state = "dying"
+
+
+def _pool(backend, size=2):
+    return DevicePool("Pixel_6_API_34", size=size, backend=backend, boot_timeout=5, kill_timeout=5, poll_interval=0)
+
+
+def test_start_boots_missing_and_adopts_running():
+    backend = FakeBackend()
+    backend.add_running(5554)
+    pool = _pool(backend)
+    pool.start()
+
+    assert backend.started == ["emulator-5556"]
+    assert [d.boots for d in pool.devices] == [0, 1]
+    assert all(d.healthy for d in pool.devices)
+
+
+def test_start_kills_offline_emulator_before_booting():
+    backend = FakeBackend()
+    backend.add_running(5554, state="offline")
+    pool = _pool(backend, size=1)
+    pool.start()
+
+    assert backend.killed == ["emulator-5554"]
+    assert backend.started == ["emulator-5554"]
+    assert backend.collisions == []
+    assert pool.devices[0].healthy
+
+
+def test_lease_restarts_unresponsive_device_after_it_exited():
+    backend = FakeBackend(exit_polls=3)
+    pool = _pool(backend, size=1)
+    pool.start()
+    backend.emulators["emulator-5554"].responsive = False
+
+    dev = pool.lease(timeout=1)
+
+    assert dev.serial == "emulator-5554"
+    assert dev.boots == 2
+    assert backend.killed == ["emulator-5554"]
+    # the new emulator was only started once the old one was gone
+    assert backend.collisions == []
+    assert backend.emulators["emulator-5554"].responsive
+    assert dev.healthy
+
+
+def test_kill_times_out_if_emulator_never_exits():
+    backend = FakeBackend(exit_polls=10**9)
+    pool = _pool(backend, size=1)
+    pool.kill_timeout = 0.05
+    pool.start()
+    backend.emulators["emulator-5554"].responsive = False
+
+    with pytest.raises(RuntimeError, match="did not exit"):
+        pool.lease(timeout=1)
+    # a failed lease hands the device back
+    assert not pool.devices[0].leased
+    assert backend.collisions == []
+
+
+def test_lease_blocks_until_release():
+    backend = FakeBackend()
+    pool = _pool(backend, size=1)
+    pool.start()
+    first = pool.lease(timeout=1)
+
+    with pytest.raises(TimeoutError):
+        pool.lease(timeout=0.05)
+
+    threading.Timer(0.05, pool.release, args=(first,)).start()
+    assert pool.lease(timeout=2) is first
+
+
+def test_shutdown_keep_warm_leaves_emulators_running():
+    backend = FakeBackend()
+    pool = _pool(backend)
+    pool.start()
+
+    pool.shutdown(keep_warm=True)
+    assert backend.killed == []
+
+    pool.shutdown(keep_warm=False)
+    assert backend.killed == ["emulator-5554", "emulator-5556"]
+    assert [row["leased"] for row in pool.status()] == [False, False]
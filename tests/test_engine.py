@@ -0,0 +1,174 @@
+import time
+from dataclasses import replace
+
+import pytest
+
+from src.engine import StepEngine, _merge_shard_totals
+from src.tools import adb
+from src.tools.capture import CAPTURE_POLICIES
+from src.tools.steps import STEP_HANDLERS
+from src.tools.types import parse_suite
+
+
+def _suite(*tests):
+    return parse_suite({"test_suite": {"name": "s", "description": "d"}, "tests": list(tests)})
+
+
+def _test(name, *steps):
+    return {"name": name, "steps": [dict(description=f"step {i}", **s) for i, s in enumerate(steps, 1)]}
+
+
+@pytest.fixture
+def sleeps(monkeypatch, fake_adb):
+    # adb.sleep (settle waits and sleep steps) is recorded; tap settles in 0.1 s to keep tests fast
+    recorded = []
+
+    def sleep(seconds):
+        recorded.append(seconds)
+        time.sleep(seconds)
+
+    monkeypatch.setattr(adb, "sleep", sleep)
+    monkeypatch.setitem(STEP_HANDLERS, "tap", replace(STEP_HANDLERS["tap"], settle_seconds=0.1))
+    return recorded
+
+
+def _run(suite, **kwargs):
+    return StepEngine(suite, **kwargs).run()
+
+
+def test_settle_is_deferred_to_the_step_that_observes_the_screen(sleeps, fake_adb):
+    log = _run(_suite(_test("t", {"type": "tap", "x": 1, "y": 1}, {"type": "screenshot"})))
+    tap, shot = log["tests"][0]["steps"]
+
+    # one wait, paid right before the screenshot and logged on it
+    assert len(sleeps) == 1 and 0.05 < sleeps[0] <= 0.1
+    assert "settle_wait_ms" not in tap
+    assert shot["settle_wait_ms"] > 0
+    tapped, shot_at = fake_adb.times("shell", "input")[0], fake_adb.times("shell", "screencap")[0]
+    assert shot_at - tapped >= 0.1
+    # the tap's latency includes its settle window
+    assert tap["settle_ms"] == 100.0
+    assert tap["duration_ms"] >= 100.0
+
+
+def test_sleep_step_never_waits_for_the_settle(sleeps):
+    log = _run(_suite(_test(
+        "t",
+        {"type": "tap", "x": 1, "y": 1},
+        {"type": "screenshot"},
+        {"type": "tap", "x": 1, "y": 1},
+        {"type": "sleep", "sleep_seconds": 0.3},
+        {"type": "screenshot"},
+    )))
+    steps = log["tests"][0]["steps"]
+
+    # the second tap is followed by a sleep, so its evidence frame waits out the settle;
+    # the sleep step itself never waits, and the screenshot after it has nothing left to wait
+    assert "settle_wait_ms" not in steps[3]
+    assert "settle_wait_ms" not in steps[4]
+    assert steps[2]["auto_screenshot"]
+
+
+def test_no_settle_after_a_step_that_did_not_change_the_screen(sleeps):
+    _run(_suite(_test("t", {"type": "screenshot"}, {"type": "sleep", "sleep_seconds": 0.01}, {"type": "screenshot"})))
+    assert sleeps == [0.01]
+
+
+def test_auto_screenshot_skipped_when_next_step_observes_the_screen(sleeps):
+    log = _run(_suite(
+        _test("a", {"type": "tap", "x": 1, "y": 1}, {"type": "screenshot"}, {"type": "keyevent", "keycode": 4}),
+        _test("b", {"type": "screenshot"}),
+    ))
+    tap, shot, key = log["tests"][0]["steps"]
+
+    assert "auto_screenshot" not in tap
+    assert "auto_screenshot" not in shot
+    # last step of a test: the next test's screenshot is not evidence for this one
+    assert key["auto_screenshot"].endswith("_a_after_3.png")
+
+
+def test_capture_after_failed_step(sleeps, fake_adb):
+    fake_adb.fail.add("input text")
+    log = _run(_suite(_test(
+        "t",
+        {"type": "input_text", "text": "x"},
+        {"type": "tap_target", "target": "Missing"},
+    )))
+    steps = log["tests"][0]["steps"]
+
+    # input_text is retried once, each failed attempt gets its own evidence
+    assert [s["type"] for s in steps[:2]] == ["input_text", "input_text"]
+    assert steps[0]["auto_screenshot"].endswith("_t_after_1.png")
+    assert steps[1]["auto_screenshot"].endswith("_t_after_1_retry1.png")
+    assert log["tests"][0]["status"] == "FAIL"
+
+
+def test_failed_step_that_captured_itself_gets_no_extra_screenshot(sleeps):
+    log = _run(_suite(_test("t", {"type": "tap_target", "target": "Missing"})), skip_rest_on_stop=True)
+    for rec in log["tests"][0]["steps"]:
+        assert not rec["ok"]
+        assert rec["locate_screenshot"]
+        assert "auto_screenshot" not in rec
+
+
+@pytest.mark.parametrize("skip_rest, expected", [(True, ["keyevent"]), (False, ["keyevent", "screenshot"])])
+def test_skip_rest_on_stop(sleeps, skip_rest, expected):
+    # keyevent without keycode fails and is not retried
+    log = _run(
+        _suite(_test("t", {"type": "keyevent"}, {"type": "screenshot"}), _test("u", {"type": "screenshot"})),
+        skip_rest_on_stop=skip_rest,
+    )
+    first, second = log["tests"]
+
+    assert [s["type"] for s in first["steps"]] == expected
+    assert first["status"] == "FAIL"
+    assert first["steps"][0]["supervisor_action"] == "stop"
+    # the next test runs either way
+    assert second["status"] == "PASS"
+
+
+def test_prefetch_hit_for_tap_target(sleeps, fake_adb):
+    log = _run(
+        _suite(_test("t", {"type": "tap", "x": 1, "y": 1}, {"type": "tap_target", "target": "Create a vault"})),
+        prefetch=True,
+    )
+    _, tap = log["tests"][0]["steps"]
+
+    assert tap["ok"] and tap["prefetch_hit"]
+    assert log["prefetch"]["hits"] == 1
+    # the locator used the prefetched tree: a single uiautomator dump in total
+    assert len(fake_adb.commands("shell", "uiautomator", "dump")) == 1
+
+
+def test_cleanup_runs_when_a_step_raises(sleeps, monkeypatch):
+    engine = StepEngine(
+        _suite(_test("t", {"type": "tap", "x": 1, "y": 1})),
+        prefetch=True,
+        capture_policy=CAPTURE_POLICIES["compact"],
+    )
+    cleaned = []
+    monkeypatch.setattr(engine.encoder, "finish", lambda: cleaned.append("captures") or {})
+    monkeypatch.setattr(engine.prefetcher, "close", lambda: cleaned.append("prefetch"))
+
+    def execute(*args):
+        raise RuntimeError("device offline")
+
+    monkeypatch.setattr(engine.executor, "execute", execute)
+
+    with pytest.raises(RuntimeError, match="device offline"):
+        engine.run()
+    assert sorted(cleaned) == ["captures", "prefetch"]
+
+
+def test_fanout_totals_sum_the_shards():
+    shard = {
+        "prefetch": {"scheduled": 2, "hits": 1, "misses": 0, "stale": 1, "errors": 0, "unused": 0,
+                     "hit_rate": 0.5, "waste_rate": 0.5},
+        "captures": {"policy": "compact", "encoded_orig_bytes": 100, "encoded_kept_bytes": 10, "encode_errors": 0},
+    }
+    run_log = {}
+    _merge_shard_totals(run_log, [shard, dict(shard, prefetch=dict(shard["prefetch"], hits=2, stale=0)), {}])
+
+    assert run_log["prefetch"]["hits"] == 3 and run_log["prefetch"]["scheduled"] == 4
+    assert run_log["prefetch"]["hit_rate"] == 0.75
+    assert run_log["captures"] == {"policy": "compact", "encoded_orig_bytes": 200, "encoded_kept_bytes": 20, "encode_errors": 0}
@@ -0,0 +1,131 @@
+import threading
+import time
+from pathlib import Path
+
+from src.tools import events
+from src.tools.events import ScreenWatcher
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def _lines(name):
+    return (FIXTURES / name).read_text(encoding="utf-8").splitlines()
+
+
+def test_replay_logcat_fixture():
+    watcher = ScreenWatcher("logcat")
+    generations = watcher.replay(_lines("logcat_events.txt"))
+
+    # am_pss, am_create_activity, am_proc_start, dvm_lock_sample, ... are not UI changes
+    assert watcher.generation == 11
+    assert generations[:3] == [0, 0, 0]
+    assert generations[-1] == 11
+    assert watcher.last_event == "input_focus"
+
+
+def test_replay_accessibility_fixture():
+    watcher = ScreenWatcher("accessibility")
+    generations = watcher.replay(_lines("accessibility_events.txt"))
+
+    # TYPE_VIEW_CLICKED / TYPE_VIEW_FOCUSED do not change what is on screen
+    assert watcher.generation == 6
+    assert generations == [0, 1, 2, 2, 3, 3, 4, 5, 6]
+    assert watcher.last_event == "TYPE_VIEW_SCROLLED"
+
+
+def _feed_later(watcher, lines, delay, interval):
+    def run():
+        time.sleep(delay)
+        for line in lines:
+            watcher.feed(line)
+            time.sleep(interval)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t
+
+
+def test_wait_quiet_returns_once_the_burst_is_over():
+    watcher = ScreenWatcher("logcat")
+    burst = _lines("logcat_events.txt")[8:12]  # activity create/resume + focus: 4 UI events
+
+    started = time.monotonic()
+    feeder = _feed_later(watcher, burst, delay=0.1, interval=0.05)
+    assert watcher.wait_quiet(since_generation=0, quiet_seconds=0.3, timeout=5.0)
+    elapsed = time.monotonic() - started
+    feeder.join()
+
+    assert watcher.generation == 4
+    # last event at ~0.25 s, then 0.3 s of quiet; far below the timeout
+    assert 0.5 <= elapsed < 1.5
+
+
+def test_wait_quiet_times_out_without_events():
+    watcher = ScreenWatcher("logcat")
+    watcher.replay(_lines("logcat_events.txt")[:3])  # no UI events
+
+    started = time.monotonic()
+    assert not watcher.wait_quiet(since_generation=0, quiet_seconds=0.1, timeout=0.3)
+    assert 0.3 <= time.monotonic() - started < 1.0
+
+
+def test_wait_quiet_is_immediate_when_already_quiet():
+    watcher = ScreenWatcher("accessibility")
+    watcher.replay(_lines("accessibility_events.txt"))
+    time.sleep(0.2)
+
+    started = time.monotonic()
+    assert watcher.wait_quiet(since_generation=0, quiet_seconds=0.1, timeout=5.0)
+    assert time.monotonic() - started < 0.1
+
+
+def test_only_content_sources_may_end_settle_early():
+    assert not ScreenWatcher("logcat").sees_content
+    assert ScreenWatcher("accessibility").sees_content
+
+
+class _SlowStream:
+    """
+    Popen stand-in whose stdout prints its first line after `delay` seconds.
+    """
+
+    def __init__(self, lines, delay):
+        self._lines, self._delay = lines, delay
+        self.stdout = self._read()
+
+    def _read(self):
+        time.sleep(self._delay)
+        yield from self._lines
+
+    def terminate(self):
+        pass
+
+    def wait(self, timeout=None):
+        return 0
+
+
+def test_start_watcher_probes_the_dump_after_the_stream_is_up(monkeypatch):
+    started = time.monotonic()
+    probed_at = []
+
+    def shell(cmd, timeout=None):
+        probed_at.append(time.monotonic())
+        return "UI hierchary dumped to: /sdcard/__qa_probe_ui.xml"
+
+    monkeypatch.setattr(events.adb, "stream", lambda args: _SlowStream(_lines("accessibility_events.txt"), 0.2))
+    monkeypatch.setattr(events.adb, "shell", shell)
+
+    watcher = events.start_watcher("accessibility")
+
+    assert watcher.source == "accessibility"
+    assert probed_at[0] - started >= 0.2
+
+
+def test_start_watcher_falls_back_to_logcat_when_dump_is_blocked(monkeypatch):
+    def shell(cmd, timeout=None):
+        raise RuntimeError("ERROR: could not get idle state")
+
+    monkeypatch.setattr(events.adb, "stream", lambda args: _SlowStream([], 0.0))
+    monkeypatch.setattr(events.adb, "shell", shell)
+
+    assert events.start_watcher("accessibility").source == "logcat"
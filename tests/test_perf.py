@@ -0,0 +1,55 @@
+import json
+
+from src.tools import perf, runlog
+
+
+def _run(run_id, ms):
+    return {
+        "run_id": run_id,
+        "suite": {"name": "s", "description": ""},
+        "tests": [
+            {
+                "name": "Launch",
+                "status": "PASS",
+                "duration_ms": ms,
+                "steps": [{"type": "launch_app", "description": "Launch", "ok": True, "duration_ms": ms}],
+            }
+        ],
+    }
+
+
+def _old_and_new(tmp_path):
+    # old runs only converted into the compact log, newer ones in both formats
+    old = [_run(f"20260101_0000{i:02d}", 100.0) for i in range(25)]
+    new = [_run(f"20260201_0000{i:02d}", 1000.0) for i in range(25)]
+    for log in old + new:
+        runlog.append_run(tmp_path / f"runs{runlog.COMPACT_SUFFIX}", log)
+    for log in new:
+        (tmp_path / f"run_{log['run_id']}.json").write_text(json.dumps(log), encoding="utf-8")
+
+
+def test_window_keeps_newest_runs_whatever_the_file_order(tmp_path):
+    _old_and_new(tmp_path)
+    hist = perf.LatencyHistory.from_logs([tmp_path])
+
+    assert hist.step_p95("Launch", "launch_app", "Launch") == 1000.0
+    assert hist.test_p95("Launch") == 1000.0
+
+
+def test_only_newest_json_files_are_read(tmp_path):
+    for i in range(10):
+        ms = 100.0 if i < 5 else 1000.0
+        log = _run(f"20260301_0000{i:02d}", ms)
+        (tmp_path / f"run_{log['run_id']}.json").write_text(json.dumps(log), encoding="utf-8")
+
+    hist = perf.LatencyHistory.from_logs([tmp_path], max_json_runs=5)
+
+    assert list(hist._steps[("Launch", "launch_app", "Launch")]) == [1000.0] * 5
+
+
+def test_budget_and_p95_breaches():
+    assert perf._check(900.0, 1000.0, None)["breaches"] == []
+    assert perf._check(1100.0, 1000.0, None)["breaches"] == ["budget"]
+    # 25% over p95 but under the absolute slack: jitter, not a regression
+    assert perf._check(130.0, None, 100.0)["breaches"] == []
+    assert perf._check(2000.0, None, 1000.0)["breaches"] == ["p95"]
@@ -0,0 +1,64 @@
+from src.agents.planner import Planner
+from src.tools.types import parse_suite
+
+
+def _suite(*tests):
+    return parse_suite({"test_suite": {"name": "s", "description": "d"}, "tests": list(tests)})
+
+
+def _matrix(values, setup_text="vault"):
+    return {
+        "name": "Note {title}",
+        "matrix": {"title": values},
+        "setup": [{"type": "input_text", "description": "open", "text": setup_text}],
+        "steps": [{"type": "input_text", "description": "type", "text": "{title}"}],
+    }
+
+
+def _run(planner, fail=()):
+    """
+    Drains the planner; fails every test whose name is in `fail` on its first step.
+    Returns (test name, step index) in the order handed out.
+    """
+    seen = []
+    while (item := planner.next_item()) is not None:
+        seen.append((item.test_name, item.step_index))
+        if item.test_name in fail:
+            planner.fail_test()
+    return seen
+
+
+def test_setup_skipped_after_a_passing_instance():
+    seen = _run(Planner(_suite(_matrix(["A", "B", "C"]))))
+
+    assert seen == [("Note A", 1), ("Note A", 2), ("Note B", 2), ("Note C", 2)]
+
+
+def test_setup_runs_again_after_a_failed_instance():
+    seen = _run(Planner(_suite(_matrix(["A", "B", "C"]))), fail={"Note A"})
+
+    assert seen == [("Note A", 1), ("Note A", 2), ("Note B", 1), ("Note B", 2), ("Note C", 2)]
+
+
+def test_setup_not_skipped_when_a_param_changes_it():
+    seen = _run(Planner(_suite(_matrix(["A", "B"], setup_text="{title}"))))
+
+    assert seen == [("Note A", 1), ("Note A", 2), ("Note B", 1), ("Note B", 2)]
+
+
+def test_setup_not_skipped_across_templates():
+    other = dict(_matrix(["A"]), name="Other {title}")
+    seen = _run(Planner(_suite(_matrix(["A"]), other)))
+
+    assert seen == [("Note A", 1), ("Note A", 2), ("Other A", 1), ("Other A", 2)]
+
+
+def test_peek_predicts_setup_skip_and_does_not_advance():
+    planner = Planner(_suite(_matrix(["A", "B"])), lookahead=2)
+    first = planner.next_item()
+
+    assert [(i.test_name, i.step_index) for i in first.upcoming] == [("Note A", 2), ("Note B", 2)]
+    # a failure is reflected in the prediction
+    planner.fail_test()
+    assert [(i.test_name, i.step_index) for i in planner.peek(2)] == [("Note A", 2), ("Note B", 1)]
+    assert planner.next_item().step_index == 2
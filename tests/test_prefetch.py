@@ -0,0 +1,84 @@
+import threading
+import time
+
+from src.tools import adb
+from src.tools.prefetch import HierarchyPrefetcher
+
+
+def _prefetcher(tmp_path, **kwargs):
+    return HierarchyPrefetcher(tmp_path / "shots", settle_seconds=0.0, wait_timeout=2.0, run_id="run1", **kwargs)
+
+
+def test_hit_when_screen_unchanged(fake_adb, tmp_path):
+    pre = _prefetcher(tmp_path)
+    pre.schedule("t", 2, expect_change=False)
+
+    got = pre.take("t", 2)
+
+    assert got is not None
+    assert got.root.find("node").get("text") == "Create a vault"
+    assert got.xml_path.name == "run1_t_prefetch_step2_ui.xml"
+    assert pre.stats()["hits"] == 1
+    pre.close()
+
+
+def test_stale_when_screen_changed_after_dump(fake_adb, tmp_path):
+    pre = _prefetcher(tmp_path)
+    pre.schedule("t", 2, expect_change=False)
+    pre._jobs["t::2"].future.result()
+    adb.tap(1, 1)
+
+    assert pre.take("t", 2) is None
+    assert pre.counts["stale"] == 1
+    pre.close()
+
+
+def test_stale_when_focused_window_changed(fake_adb, tmp_path):
+    pre = _prefetcher(tmp_path)
+    pre.schedule("t", 2, expect_change=False)
+    pre._jobs["t::2"].future.result()
+    fake_adb.focus = "com.android.permissioncontroller/.GrantPermissionsActivity"
+
+    assert pre.take("t", 2) is None
+    assert pre.counts["stale"] == 1
+    pre.close()
+
+
+def test_miss_error_and_unused_counts(fake_adb, tmp_path):
+    pre = _prefetcher(tmp_path)
+    assert pre.take("t", 1) is None
+
+    fake_adb.fail.add("uiautomator dump")
+    pre.schedule("t", 2, expect_change=False)
+    assert pre.take("t", 2) is None
+    fake_adb.fail.clear()
+
+    pre.schedule("t", 3, expect_change=False)
+    pre.discard()
+
+    stats = pre.stats()
+    assert (stats["misses"], stats["errors"], stats["unused"], stats["scheduled"]) == (1, 1, 1, 2)
+    assert stats["hit_rate"] == 0.0
+    assert stats["waste_rate"] == 1.0
+    pre.close()
+
+
+def test_dump_waits_for_the_action_and_not_before(fake_adb, tmp_path):
+    pre = _prefetcher(tmp_path)
+    not_before = time.monotonic() + 0.2
+    pre.schedule("t", 2, expect_change=True, settle_seconds=0.1, not_before=not_before)
+
+    tapped_at = []
+
+    def act():
+        time.sleep(0.05)
+        tapped_at.append(time.monotonic())
+        adb.tap(1, 1)
+
+    threading.Thread(target=act).start()
+    assert pre.take("t", 2) is not None
+
+    dumped_at = fake_adb.times("shell", "uiautomator", "dump")[0]
+    assert dumped_at >= not_before + 0.1
+    assert dumped_at >= tapped_at[0] + 0.1
+    pre.close()
@@ -0,0 +1,92 @@
+import gzip
+import json
+
+from src.tools.runlog import append_run, iter_runs, query, write_run
+
+
+def _run_log(run_id="20250101_120000", shots="artifacts\\screenshots"):
+    def step(n, **kw):
+        return {
+            "type": "tap_target",
+            "description": "Tap Create a vault",
+            "ok": True,
+            "duration_ms": 100.0 + n,
+            "screenshot": f"{shots}\\{run_id}_t_step{n}.png",
+            **kw,
+        }
+
+    return {
+        "run_id": run_id,
+        "suite": {"name": "s", "description": "d"},
+        "perf": {"flagged": 0},
+        "tests": [
+            {"name": "t", "status": "PASS", "duration_ms": 500.0, "steps": [step(1), step(2)]},
+            {
+                "name": "u",
+                "status": "FAIL",
+                "steps": [step(3, ok=False, error="not found", failure_type="LOCATOR_MISS")],
+            },
+        ],
+    }
+
+
+def _posix(run_log):
+    return json.loads(json.dumps(run_log).replace("\\\\", "/"))
+
+
+def test_write_then_read_round_trip(tmp_path):
+    run_log = _run_log()
+    path = append_run(tmp_path / "runs.jsonl.gz", run_log)
+
+    # same run back, only with "/" separators in paths
+    assert list(iter_runs([path])) == [_posix(run_log)]
+
+
+def test_path_outside_shots_dir_survives(tmp_path):
+    run_log = _run_log()
+    steps = run_log["tests"][0]["steps"]
+    steps[0]["prefetch_xml"] = "artifacts/prefetch/t_prefetch_step1_ui.xml"
+    steps[1]["auto_screenshot"] = "after_2.png"  # bare name in the working directory
+    path = append_run(tmp_path / "runs.jsonl.gz", run_log)
+
+    got = next(iter_runs([path]))["tests"][0]["steps"]
+    assert got[0]["prefetch_xml"] == "artifacts/prefetch/t_prefetch_step1_ui.xml"
+    assert got[1]["auto_screenshot"] == "after_2.png"
+    assert got[0]["screenshot"] == "artifacts/screenshots/20250101_120000_t_step1.png"
+
+
+def test_bare_names_with_no_shots_dir(tmp_path):
+    run_log = _run_log(shots=".")
+    for test in run_log["tests"]:
+        for rec in test["steps"]:
+            rec["screenshot"] = rec["screenshot"].split("\\")[-1]
+    path = append_run(tmp_path / "runs.jsonl.gz", run_log)
+
+    assert list(iter_runs([path])) == [run_log]
+
+
+def test_query_counts_a_run_once_across_json_and_compact(tmp_path):
+    first, second = _run_log("20250101_120000"), _run_log("20250102_120000")
+    (tmp_path / "run_20250101_120000.json").write_text(json.dumps(first), encoding="utf-8")
+    (tmp_path / "run_20250102_120000.json").write_text(json.dumps(second), encoding="utf-8")
+    # the first run was also converted into the compact log next to it
+    with gzip.open(tmp_path / "runs.jsonl.gz", "wt", encoding="utf-8") as f:
+        write_run(f, first)
+
+    report = query([tmp_path])
+
+    assert (report["runs"], report["tests"], report["steps"]) == (2, 4, 6)
+    assert report["step_latency_ms"]["tap_target"]["count"] == 6
+    assert report["failure_types_by_day"] == {"20250101": {"LOCATOR_MISS": 1}, "20250102": {"LOCATOR_MISS": 1}}
+
+
+def test_test_level_perf_regressions_reported_apart_from_steps(tmp_path):
+    run_log = _run_log()
+    run_log["tests"][0]["failure_type"] = "PERF_REGRESSION"
+    run_log["tests"][0]["steps"][1]["failure_type"] = "PERF_REGRESSION"
+    path = append_run(tmp_path / "runs.jsonl.gz", run_log)
+
+    report = query([path])
+
+    assert report["failure_types_by_day"] == {"20250101": {"PERF_REGRESSION": 1, "LOCATOR_MISS": 1}}
+    assert report["test_perf_regressions_by_day"] == {"20250101": 1}
@@ -0,0 +1,82 @@
+import queue
+
+import pytest
+
+from src.tools.types import ExpandedTests, matrix_params, matrix_work, parse_suite
+
+
+def _suite(*tests):
+    return parse_suite({"test_suite": {"name": "s", "description": "d"}, "tests": list(tests)})
+
+
+def _steps(*descriptions):
+    return [{"type": "screenshot", "description": d} for d in descriptions]
+
+
+MATRIX = {
+    "name": "Create note {title}",
+    "matrix": {"title": ["A", "B"], "locale": ["en-US", "de-DE", "fr-FR"]},
+    "steps": _steps("type {title} in {locale}"),
+}
+
+
+def test_matrix_params_last_key_fastest():
+    template = _suite(MATRIX).templates[0]
+
+    assert [matrix_params(template, c) for c in (0, 1, 3)] == [
+        {"title": "A", "locale": "en-US"},
+        {"title": "A", "locale": "de-DE"},
+        {"title": "B", "locale": "en-US"},
+    ]
+
+
+def test_instance_names_and_order():
+    suite = _suite({"name": "first", "steps": _steps("x")}, MATRIX, {"name": "last", "steps": _steps("y")})
+    names = [t.name for t in suite.tests]
+
+    # params not in the name are appended so instance names stay unique
+    assert names == [
+        "first",
+        "Create note A [locale=en-US]",
+        "Create note A [locale=de-DE]",
+        "Create note A [locale=fr-FR]",
+        "Create note B [locale=en-US]",
+        "Create note B [locale=de-DE]",
+        "Create note B [locale=fr-FR]",
+        "last",
+    ]
+    inst = suite.tests[5]
+    assert inst.steps[0].description == "type B in de-DE"
+    assert inst.template == "Create note {title}"
+    assert inst.params == {"title": "B", "locale": "de-DE"}
+
+
+def test_expanded_tests_indexing():
+    tests = _suite({"name": "first", "steps": _steps("x")}, MATRIX).tests
+
+    assert isinstance(tests, ExpandedTests)
+    assert len(tests) == 7
+    assert tests[-1].name == "Create note B [locale=fr-FR]"
+    assert [t.name for t in tests[:2]] == ["first", "Create note A [locale=en-US]"]
+    with pytest.raises(IndexError):
+        tests[7]
+
+
+def test_worker_share_runs_plain_tests_once_and_claims_instances():
+    suite = _suite({"name": "first", "steps": _steps("x")}, MATRIX)
+    work = queue.Queue()
+    for item in matrix_work(suite.templates):
+        work.put(item)
+
+    a = suite.worker_share(work, run_plain=True).tests
+    b = suite.worker_share(work, run_plain=False).tests
+
+    # workers claim as they go; len() keeps one instance ahead claimed
+    assert a[0].name == "first"
+    assert b[0].name == "Create note A [locale=en-US]"
+    assert a[1].name == "Create note A [locale=de-DE]"
+    assert len(b) == 2
+    names = [t.name for t in a] + [t.name for t in b]
+
+    assert work.empty()
+    assert sorted(names) == sorted(t.name for t in suite.tests)